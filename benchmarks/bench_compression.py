@@ -0,0 +1,83 @@
+"""
+Benchmark of the stream compression codecs.
+
+Compresses detector data with every available codec and reports the
+compression ratio and throughput, to choose the `compression` setting
+of a detector. Synthetic low-intensity data is used unless a run is given.
+
+Usage:
+    python benchmarks/bench_compression.py [--run DIR --detector NAME]
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from image_analysis.webapp.core.compression import (
+    ArrayCodec, available_codecs)
+from image_analysis.webapp.core.file_server import detector_devices
+
+
+def load_arrays(run_dir, detector, n_trains):
+    from karabo_data import RunDirectory
+
+    run = RunDirectory(run_dir)
+    arrays = []
+    for i, (tid, data) in enumerate(run.trains(
+            devices=detector_devices(detector), require_all=True)):
+        if i == n_trains:
+            break
+        arrays.extend(value for src in data.values()
+                      for value in src.values()
+                      if isinstance(value, np.ndarray) and value.size > 1)
+    return arrays
+
+
+def run(name, arrays, repeat):
+    codec = ArrayCodec(name)
+    raw = sum(array.nbytes for array in arrays)
+    outs = [np.empty_like(array) for array in arrays]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        frames = [codec.compress(array) for array in arrays]
+    t_compress = (time.perf_counter() - t0) / repeat
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for frame, out in zip(frames, outs):
+            codec.decompress(frame, out)
+    t_decompress = (time.perf_counter() - t0) / repeat
+
+    compressed = sum(len(frame) for frame in frames)
+    mbytes = raw / 1024**2
+    return raw / compressed, mbytes / t_compress, mbytes / t_decompress
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--run", help="run directory, synthetic data if omitted")
+    ap.add_argument("--detector", default="LPD")
+    ap.add_argument("--trains", type=int, default=5)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    if args.run:
+        arrays = load_arrays(args.run, args.detector, args.trains)
+    else:
+        # LPD-like modules with a few photons per pixel
+        arrays = [np.random.poisson(3., (64, 16, 256, 256)).astype(np.uint16)
+                  for _ in range(args.trains)]
+
+    print(f"{sum(a.nbytes for a in arrays) / 1024**2:.0f} MB")
+    print(f"{'codec':>8} {'ratio':>8} {'comp MB/s':>10} {'decomp MB/s':>12}")
+    for name in available_codecs():
+        ratio, compress, decompress = run(name, arrays, args.repeat)
+        print(f"{name:>8} {ratio:>8.2f} {compress:>10.0f} {decompress:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the processing pipeline in different precisions.
+
+Runs assembly, masking and pulse averaging of synthetic LPD-like trains
+for every precision and reports throughput and peak memory.
+
+Usage:
+    python benchmarks/bench_precision.py [--pulses N] [--trains N]
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from image_analysis.webapp.core import config, DataProcessorWorker
+from image_analysis.webapp.core.transforms import PixelMap
+
+MODULES_SHAPE = (16, 256, 256)
+IMAGE_SHAPE = (1024, 1024)
+
+
+def make_pixel_map():
+    """Place the modules on a 4 x 4 grid, like a geometry would."""
+    index = np.arange(np.prod(MODULES_SHAPE)).reshape(4, 4, 256, 256)
+    index = index.transpose(0, 2, 1, 3).reshape(IMAGE_SHAPE)
+    return PixelMap(index, IMAGE_SHAPE)
+
+
+def run(precision, stacked, n_trains):
+    config["DETECTOR"] = "LPD"
+    config["LPD"]["precision"] = precision
+
+    processor = DataProcessorWorker(None, None)
+    processor._pixel_map = make_pixel_map()
+    processor._pixel_map_key = MODULES_SHAPE
+    # only the clip range, onAiParamsChange would warm an integrator
+    processor._ai_params = dict(mask_rng=config["LPD"]["mask_rng"])
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for tid in range(n_trains):
+        assembled = processor.assemble_stacked(stacked)
+        processor.process_train(tid, assembled)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return n_trains / elapsed, peak / 1024**2
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pulses", type=int, default=64)
+    ap.add_argument("--trains", type=int, default=10)
+    args = ap.parse_args()
+
+    stacked = np.random.uniform(
+        0, 4000, (args.pulses,) + MODULES_SHAPE).astype(np.float32)
+
+    print(f"{args.pulses} pulses, {args.trains} trains")
+    print(f"{'precision':>10} {'trains/s':>10} {'peak MB':>10}")
+    for precision in ["float64", "float32", "float16"]:
+        rate, peak = run(precision, stacked, args.trains)
+        print(f"{precision:>10} {rate:>10.2f} {peak:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ All rights reserved.
 """
 import argparse
 
-from .webapp import DashApp
+from .webapp.core import config
 
 
 def run_dashservice():
@@ -16,7 +16,24 @@ def run_dashservice():
                              for det in ["jungfrau", "LPD", "AGIPD"]],
                     type=lambda s: s.upper())
     ap.add_argument("hostname", help="Hostname")
-    ap.add_argument("port", help="TCP port to run server on")
+    ap.add_argument("port", help="TCP port to run server on, or comma "
+                    "separated ports of several endpoints streaming parts "
+                    "of the trains")
+    ap.add_argument("--workers", help="number of processes used for the "
+                    "analysis, 0 processes in a thread (default). With "
+                    "--distributed, number of local processing nodes",
+                    type=int, default=0)
+    ap.add_argument("--distributed", action="store_true",
+                    help="dispatch trains to processing nodes started with "
+                    "image_analysis_node")
+    ap.add_argument("--push", action="store_true",
+                    help="push new data to the browsers instead of polling")
+    ap.add_argument("--memory-budget", type=float, default=None,
+                    help="memory budget in GB, above which the processing "
+                    "is degraded")
+    ap.add_argument("--pulse-splits", help="number of pulse ranges each "
+                    "train is split into in distributed mode",
+                    type=int, default=1)
     args = ap.parse_args()
 
     detector = args.detector
@@ -26,8 +43,113 @@ def run_dashservice():
     hostname = args.hostname
     port = args.port
 
-    app = DashApp(detector, hostname, port)
+    from .webapp import DashApp
+
+    app = DashApp(detector, hostname, port, n_workers=args.workers,
+                  distributed=args.distributed, n_parts=args.pulse_splits,
+                  push=args.push, memory_budget=args.memory_budget)
     app.recieve()
     app.process()
 
     app._app.run_server(debug=False)
+
+
+def run_processing_node():
+    ap = argparse.ArgumentParser(prog="imageAnalysisNode")
+    ap.add_argument("hostname", help="Hostname of the dashboard dispatching "
+                    "the trains")
+    ap.add_argument("--dispatch-port", type=int,
+                    default=config["DISPATCH_PORT"])
+    ap.add_argument("--collect-port", type=int,
+                    default=config["COLLECT_PORT"])
+    args = ap.parse_args()
+
+    from .webapp.core import run_node
+
+    run_node(f"tcp://{args.hostname}:{args.dispatch_port}",
+             f"tcp://{args.hostname}:{args.collect_port}")
+
+
+def run_offline():
+    ap = argparse.ArgumentParser(prog="offlineImageAnalysis")
+    ap.add_argument("detector", help="detector name (case insensitive)",
+                    choices=[det.upper()
+                             for det in ["jungfrau", "LPD", "AGIPD"]],
+                    type=lambda s: s.upper())
+    ap.add_argument("run", help="run directory")
+    ap.add_argument("output", help="HDF5 file of the results")
+    ap.add_argument("--analysis-type", default="AzimuthalIntegration",
+                    choices=["ROI", "AzimuthalIntegration",
+                             "AzimuthalIntegration2D", "XPCS"])
+    ap.add_argument("--workers", type=int, default=None,
+                    help="number of processes, by default one per CPU")
+    ap.add_argument("--energy", type=float)
+    ap.add_argument("--distance", type=float)
+    ap.add_argument("--pixel-size", type=float)
+    ap.add_argument("--centerx", type=float)
+    ap.add_argument("--centery", type=float)
+    ap.add_argument("--int-mthd")
+    ap.add_argument("--int-pts", type=int)
+    ap.add_argument("--azim-pts", type=int)
+    ap.add_argument("--cake-pulses",
+                    help="pulse pattern of the pulses of which the cakes "
+                    "are recorded (AzimuthalIntegration2D), e.g. 0:10")
+    ap.add_argument("--xpcs-rings", type=int)
+    ap.add_argument("--int-rng", type=float, nargs=2)
+    ap.add_argument("--mask-rng", type=float, nargs=2)
+    ap.add_argument("--source", nargs="+",
+                    help="detector sources (JungFrau), modules of several "
+                    "receivers are stacked")
+    ap.add_argument("--geom-file")
+    ap.add_argument("--mask-file")
+    ap.add_argument("--edge-mask", action="store_true")
+    ap.add_argument("--sparse-threshold", type=float,
+                    help="analyse the pixels above threshold as sparse "
+                    "photon events")
+    ap.add_argument("--pp-on", help="pulse pattern of pumped pulses")
+    ap.add_argument("--pp-off", help="pulse pattern of unpumped pulses")
+    ap.add_argument("--slow", nargs=2, metavar=("SOURCE", "PROPERTY"),
+                    help="slow property recorded with every train")
+    args = ap.parse_args()
+
+    detector = args.detector
+    if detector == 'JUNGFRAU':
+        detector = 'JungFrau'
+    det_config = config[detector]
+
+    def default(value, key):
+        return det_config[key] if value is None else value
+
+    ai_params = dict(
+        energy=default(args.energy, "energy"),
+        distance=default(args.distance, "distance"),
+        pixel_size=default(args.pixel_size, "pixel_size"),
+        centerx=default(args.centerx, "centerx"),
+        centery=default(args.centery, "centery"),
+        int_mthd=args.int_mthd or det_config["int_mthds"][0],
+        int_pts=default(args.int_pts, "int_pts"),
+        azim_pts=default(args.azim_pts, "azim_pts"),
+        cake_pulses=default(args.cake_pulses, "cake_pulses"),
+        xpcs_rings=default(args.xpcs_rings, "xpcs_rings"),
+        int_rng=default(args.int_rng, "int_rng"),
+        mask_rng=default(args.mask_rng, "mask_rng"),
+    )
+    pp_patterns = None
+    if args.pp_on and args.pp_off:
+        pp_patterns = (args.pp_on, args.pp_off)
+    params = dict(detector=detector,
+                  analysis_type=args.analysis_type,
+                  ai_params=ai_params,
+                  source_name=args.source or det_config["source_name"][:1],
+                  geom_file=default(args.geom_file, "geom_file"),
+                  mask_file=default(args.mask_file, "mask_file"),
+                  edge_mask=args.edge_mask,
+                  mask_rects=None,
+                  pp_patterns=pp_patterns,
+                  sparse_threshold=default(
+                      args.sparse_threshold, "sparse_threshold"))
+
+    from .webapp.core.offline import process_run
+
+    process_run(args.run, args.output, params, slow=args.slow,
+                n_workers=args.workers)
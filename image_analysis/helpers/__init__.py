@@ -1,5 +1,7 @@
 from .utils import (
+    get_process_memory,
     get_virtual_memory)
 
 __all__ = [
+    "get_process_memory",
     "get_virtual_memory",]
@@ -9,3 +9,15 @@ import psutil as ps
 def get_virtual_memory():
     virtual_memory, swap_memory = ps.virtual_memory(), ps.swap_memory()
     return virtual_memory, swap_memory
+
+
+def get_process_memory():
+    """Return the resident set size of this process and its children."""
+    process = ps.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except ps.Error:
+            continue
+    return rss
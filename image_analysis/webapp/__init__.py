@@ -1,4 +1,11 @@
-from .app import DashApp
-
 __all__ = [
     "DashApp"]
+
+
+def __getattr__(name):
+    # Dash is only imported when the web application is used, processing
+    # nodes and offline tools do not need it.
+    if name == "DashApp":
+        from .app import DashApp
+        return DashApp
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,6 +8,7 @@ from math import ceil
 import numpy as np
 import queue
 from queue import Queue
+from threading import Thread
 
 import dash
 import dash_html_components as html
@@ -16,14 +17,20 @@ from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 
 from .core import (
-    config, DaqWorker, DataProcessorWorker, FileServer, ProcessedData)
+    config, DaqWorker, DataProcessorWorker, DistributedDataProcessor,
+    FileServer, MemoryGovernor, ParallelDataProcessor, ProcessedData,
+    ProcessingNode)
 from .layout import get_layout, _SOURCE
+from .broadcast import RenderCache
+from .push import PANELS, SnapshotNotifier
 from ..helpers import get_virtual_memory
 
 
 class DashApp:
 
-    def __init__(self, detector, hostname, port):
+    def __init__(self, detector, hostname, port, n_workers=0,
+                 distributed=False, n_parts=1, push=False,
+                 memory_budget=None):
         app = dash.Dash(__name__)
         app.config['suppress_callback_exceptions'] = True
         self._hostname = hostname
@@ -34,30 +41,67 @@ class DashApp:
         self._config = config[detector]
         self._app = app
 
-        self._data = None
+        self._push = push
+        # parameters are applied on the first page load only, then on
+        # changes of the controls
+        self._params_applied = False
+        # shared by all viewers, the processed data is only taken
+        # from the queue by the consumer thread
+        self._notifier = SnapshotNotifier()
+        self._render_cache = RenderCache()
+        if push:
+            self._notifier.register(app.server)
+        # down-sampling of the displayed image
+        self._image_step = 3
         self._data_queue = Queue(maxsize=1)
         self._proc_queue = Queue(maxsize=1)
         self.reciever = DaqWorker(
-            self._hostname, self._port, self._data_queue)
-        self.processor = DataProcessorWorker(
-            self._data_queue, self._proc_queue)
+            self._hostname, self._port, self._data_queue,
+            compression=self._config.get("compression"))
+        self._nodes = []
+        if distributed:
+            self.processor = DistributedDataProcessor(
+                self._data_queue, self._proc_queue, config["DISPATCH_PORT"],
+                config["COLLECT_PORT"], n_parts=n_parts)
+            # local processes standing in for processing nodes
+            self._nodes = [ProcessingNode(
+                f"tcp://localhost:{config['DISPATCH_PORT']}",
+                f"tcp://localhost:{config['COLLECT_PORT']}")
+                for _ in range(n_workers)]
+        elif n_workers > 0:
+            self.processor = ParallelDataProcessor(
+                self._data_queue, self._proc_queue, n_workers)
+        else:
+            self.processor = DataProcessorWorker(
+                self._data_queue, self._proc_queue)
+
+        self._governor = None
+        if memory_budget is None:
+            memory_budget = config["MEMORY_BUDGET"]
+        if memory_budget:
+            self._governor = MemoryGovernor(memory_budget)
+            self._governor.register(self.processor.onMemoryLevelChange)
+            self._governor.register(self.onMemoryLevelChange)
 
         self.setLayout()
         self.register_callbacks()
 
     def setLayout(self):
-        self._app.layout = get_layout(config["TIME_OUT"], self._config)
+        self._app.layout = get_layout(
+            config["TIME_OUT"], self._config, push=self._push)
 
     def register_callbacks(self):
         """Register callbacks"""
         @self._app.callback(
             Output('train-id', 'value'),
-            [Input('interval_component', 'n_intervals')])
-        def update_train_id(n):
-            self._update()
-            if self._data is None:
+            [Input('interval_component', 'n_intervals'),
+             Input('push-trigger', 'n_clicks')],
+            [State('train-id', 'value')])
+        def update_train_id(n, n_pushed, current):
+            data, _ = self._notifier.latest
+            if data is None or str(data.tid) == current:
                 raise dash.exceptions.PreventUpdate
-            return str(self._data.tid)
+            return str(data.tid)
 
         @self._app.callback(
             [Output('virtual_memory', 'value'),
@@ -73,18 +117,61 @@ class DashApp:
             return ((virtual.used/1024**3), ceil((virtual.total/1024**3)),
                     (swap.used/1024**3), ceil((swap.total/1024**3)))
 
+        @self._app.callback(
+            Output('governor-info', 'children'),
+            [Input('psutil_component', 'n_intervals')])
+        def update_governor_info(n):
+            if self._governor is None:
+                raise dash.exceptions.PreventUpdate
+            info = [html.Div(
+                f"Process memory {self._governor.rss / 1024**3:.1f} GB, "
+                f"degradation level {self._governor.level}")]
+            info.extend(html.Div(message)
+                        for message in reversed(self._governor.log[-3:]))
+            return info
+
+        @self._app.callback(
+            Output('record-state', 'children'),
+            [Input('record', 'on')],
+            [State('record-file', 'value')])
+        def record(state, filename):
+            if state and not filename:
+                return "Output file missing"
+            self.processor.onRecordingChange(state, filename)
+            return f"Recording to {filename}" if state else ""
+
+        @self._app.callback(
+            Output('record-info', 'children'),
+            [Input('psutil_component', 'n_intervals')])
+        def update_record_info(n):
+            stats = self.processor.recorder_stats()
+            if stats is None:
+                return ""
+            return (f"{stats['written']} trains written "
+                    f"({stats['mbytes']:.1f} MB, "
+                    f"{stats['throughput']:.1f} MB/s), "
+                    f"backlog: {stats['backlog']}, "
+                    f"dropped: {stats['dropped']}")
+
         @self._app.callback(
             Output('stream-info', 'children'),
             [Input('stream', 'on')],
             [State('run-folder', 'value'),
-             State('port', 'value')])
-        def stream(state, folder, port):
+             State('port', 'value'),
+             State('slow-source', 'value'),
+             State('slow-prop', 'value')])
+        def stream(state, folder, port, slow_source, slow_prop):
             info = ""
             if state:
                 if not (folder and port):
                     info = f"Either Folder or port number missing"
                     return [info]
-                self._file_server = FileServer(folder, port)
+                slow_devices = None
+                if slow_source and slow_prop:
+                    slow_devices = [(slow_source, slow_prop)]
+                self._file_server = FileServer(
+                    folder, port, slow_devices=slow_devices,
+                    compression=self._config.get("compression"))
                 try:
                     print("Start ", self._file_server)
                     self._file_server.start()
@@ -101,123 +188,257 @@ class DashApp:
 
             return [info]
 
+        @self._app.callback(
+            Output('compression-info', 'children'),
+            [Input('psutil_component', 'n_intervals')])
+        def update_compression_info(n):
+            stats = self.reciever.stats()
+            if stats is None or not stats['trains']:
+                raise dash.exceptions.PreventUpdate
+            return (f"{stats['codec']}: compression ratio "
+                    f"{stats['ratio']:.2f}, "
+                    f"{stats['compress_ms']:.1f} ms compression, "
+                    f"{stats['decompress_ms']:.1f} ms decompression "
+                    f"per train")
+
+        @self._app.callback(
+            Output('matcher-info', 'children'),
+            [Input('psutil_component', 'n_intervals')])
+        def update_matcher_info(n):
+            stats = self.reciever.matcher_stats()
+            if stats is None:
+                raise dash.exceptions.PreventUpdate
+            return (f"Trains matched: {stats['matched']}, "
+                    f"partial: {stats['partial']}, "
+                    f"dropped: {stats['dropped']}, "
+                    f"pending: {stats['pending']}")
+
         @self._app.callback(Output('mean-image', 'figure'),
                             [Input('color-scale', 'value'),
                              Input('train-id', 'value')])
         def update_image_figure(color_scale, tid):
-            if self._data.tid != int(tid) or self._data.image is None:
+            data, panels = self._snapshot(tid)
+            if data.image is None or self._unchanged('mean-image', panels):
                 raise dash.exceptions.PreventUpdate
 
-            traces = [go.Heatmap(
-                z=self._data.image[::3, ::3], colorscale=color_scale)]
-            figure = {
-                'data': traces,
-                'layout': go.Layout(
-                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
-                )
-            }
+            def render():
+                image = data.image
+                if data.image_avg is not None:
+                    image = data.image_avg
+                step = self._image_step
+                traces = [go.Heatmap(
+                    z=image[::step, ::step], colorscale=color_scale)]
+                return {
+                    'data': traces,
+                    'layout': go.Layout(
+                        margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                        dragmode='select',
+                    )
+                }
 
-            return figure
+            return self._render_cache.get(
+                ('mean-image', data.tid, color_scale, self._image_step),
+                render)
 
         @self._app.callback(Output('histogram', 'figure'),
                             [Input('train-id', 'value')])
         def update_histogram_figure(tid):
-            if self._data.tid != int(tid) or self._data.image is None:
+            data, panels = self._snapshot(tid)
+            if data.image is None or self._unchanged('histogram', panels):
                 raise dash.exceptions.PreventUpdate
-            hist, bins = np.histogram(self._data.image.ravel(), bins=10)
-            bin_center = (bins[1:] + bins[:-1])/2.0
-            traces = [{'x': bin_center, 'y': hist,
-                       'type': 'bar'}]
-            figure = {
-                'data': traces,
-                'layout': go.Layout(
-                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
-                )
-            }
 
-            return figure
+            def render():
+                title = None
+                if data.event_histogram is not None:
+                    # values of the photon events in sparse mode
+                    hist, bins = data.event_histogram
+                    title = f"Occupancy {100 * data.occupancy:.2f} %"
+                else:
+                    image = data.image
+                    if data.mask is not None:
+                        image = image[~data.mask]
+                    hist, bins = np.histogram(image.ravel(), bins=10)
+                bin_center = (bins[1:] + bins[:-1])/2.0
+                traces = [{'x': bin_center, 'y': hist,
+                           'type': 'bar'}]
+                return {
+                    'data': traces,
+                    'layout': go.Layout(
+                        title=title,
+                        margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                    )
+                }
+
+            return self._render_cache.get(('histogram', data.tid), render)
 
         @self._app.callback(Output('ai-integral', 'figure'),
                             [Input('train-id', 'value')],
                             [State('analysis-type', 'value'),
                              State('roi-projection', 'value'),
-                             State('n-pulses', 'value')]
+                             State('n-pulses', 'value'),
+                             State('color-scale', 'value')]
                             )
-        def update_correlation_figure(tid, analysis_type, projection, pulses):
-            if self._data.tid != int(tid):
-                raise dash.exceptions.PreventUpdate
-            if analysis_type == "ROI":
-                try:
-                    y = getattr(self._data, f"{projection}")
-                    traces = [go.Scatter(
-                        x=np.arange(y.shape[1]), y=y[i]) for i in range(
-                            y[:pulses, ...].shape[0])]
-                except Exception:
-                    raise dash.exceptions.PreventUpdate
-            elif analysis_type == "AzimuthalIntegration":
-                try:
-                    y = getattr(self._data, "intensities")
-                    x = getattr(self._data, "momentum")
-                    traces = [go.Scatter(x=x, y=y[i])
-                              for i in range(y[:pulses, ...].shape[0])]
-                except Exception as ex:
-                    raise dash.exceptions.PreventUpdate
-            else:
+        def update_correlation_figure(tid, analysis_type, projection, pulses,
+                                      color_scale):
+            data, panels = self._snapshot(tid)
+            if self._unchanged('ai-integral', panels):
                 raise dash.exceptions.PreventUpdate
 
-            figure = {
-                'data': traces,
-                'layout': go.Layout(
-                    xaxis={'title': 'q'},
-                    yaxis={'title': 'I(q)'},
-                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
-                    hovermode='closest',
-                    showlegend=False)}
+            def render():
+                return self._render_integral(
+                    data, analysis_type, projection, pulses, color_scale)
 
-            return figure
+            return self._render_cache.get(
+                ('ai-integral', data.tid, analysis_type, projection, pulses,
+                 color_scale), render)
 
         @self._app.callback(Output('fom-plot', 'figure'),
                             [Input('train-id', 'value')])
         def update_fom_figure(tid):
-            if self._data.tid != int(tid):
+            data, panels = self._snapshot(tid)
+            if data.fom is None or self._unchanged('fom-plot', panels):
                 raise dash.exceptions.PreventUpdate
 
-            data = self._data.fom
-            if data is None:
+            def render():
+                traces = [go.Box(
+                    y=foms,
+                    name=str(tid), marker_color='lightseagreen',
+                    boxmean='sd') for tid, foms in list(data.fom)]
+                return {
+                    'data': traces,
+                    'layout': go.Layout(
+                        margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                        showlegend=False,
+                    )
+                }
+
+            return self._render_cache.get(('fom-plot', data.tid), render)
+
+        @self._app.callback(Output('correlation-plot', 'figure'),
+                            [Input('train-id', 'value')],
+                            [State('slow-prop', 'value')])
+        def update_correlation_plot(tid, slow_prop):
+            data, panels = self._snapshot(tid)
+            if data.correlation is None \
+                    or self._unchanged('correlation-plot', panels):
                 raise dash.exceptions.PreventUpdate
-            data = list(data)
-            traces = [go.Box(
-                y=foms,
-                name=str(tid), marker_color='lightseagreen',
-                boxmean='sd') for tid, foms in data]
-            figure = {
-                'data': traces,
-                'layout': go.Layout(
-                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
-                    showlegend=False,
-                )
-            }
 
-            return figure
+            def render():
+                centers, mean, std, count = data.correlation
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    error = std / np.sqrt(count)
+                traces = [go.Scatter(
+                    x=centers, y=mean, mode='markers+lines',
+                    error_y=dict(type='data', array=error, visible=True),
+                    marker_color='lightseagreen')]
+                return {
+                    'data': traces,
+                    'layout': go.Layout(
+                        xaxis={'title': slow_prop},
+                        yaxis={'title': 'FOM'},
+                        margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                        showlegend=False,
+                    )
+                }
 
-        @self._app.callback(Output('logger', 'children'),
+            return self._render_cache.get(
+                ('correlation-plot', data.tid, slow_prop), render)
+
+        @self._app.callback(Output('pp-plot', 'figure'),
                             [Input('train-id', 'value')],
                             [State('analysis-type', 'value'),
-                             State('energy', 'value'),
-                             State('distance', 'value'),
-                             State('pixel-size', 'value'),
-                             State('centrex', 'value'),
-                             State('centrey', 'value'),
-                             State('int-mthd', 'value'),
-                             State('int-pts', 'value'),
-                             State('int-rng', 'value'),
-                             State('mask-rng', 'value'),
-                             State('geom-file', 'value'),
-                             State('source', 'value')
-                             ]
-                            )
-        def update_params(tid,
-                          analysis_type,
+                             State('roi-projection', 'value')])
+        def update_pump_probe_plot(tid, analysis_type, projection):
+            data, panels = self._snapshot(tid)
+            if data.pump_probe_avg is None \
+                    or self._unchanged('pp-plot', panels):
+                raise dash.exceptions.PreventUpdate
+            key = projection if analysis_type == "ROI" else "intensities"
+            if key not in data.pump_probe_avg:
+                raise dash.exceptions.PreventUpdate
+
+            def render():
+                on, off, diff = data.pump_probe_avg[key]
+                x = data.momentum if key == "intensities" \
+                    else np.arange(len(diff))
+                traces = [go.Scatter(x=x, y=on, name='on'),
+                          go.Scatter(x=x, y=off, name='off'),
+                          go.Scatter(x=x, y=diff, name='on - off',
+                                     yaxis='y2',
+                                     line=dict(color='black', width=3))]
+                return {
+                    'data': traces,
+                    'layout': go.Layout(
+                        title=f"{data.n_pump_probe} trains",
+                        yaxis2=dict(overlaying='y', side='right'),
+                        margin={'l': 40, 'b': 40, 't': 40, 'r': 40},
+                    )
+                }
+
+            return self._render_cache.get(
+                ('pp-plot', data.tid, key), render)
+
+        @self._app.callback(Output('corr-info', 'children'),
+                            [Input('corr-reset', 'n_clicks')])
+        def reset_correlation(n_clicks):
+            if not n_clicks:
+                raise dash.exceptions.PreventUpdate
+            self.processor.resetCorrelation()
+            return "Correlation reset"
+
+        @self._app.callback([Output('mask-rects', 'data'),
+                             Output('mask-info', 'children')],
+                            [Input('mean-image', 'selectedData'),
+                             Input('clear-mask', 'n_clicks')],
+                            [State('mask-rects', 'data')])
+        def update_mask_rects(selected, n_clicks, rects):
+            triggered = dash.callback_context.triggered[0]['prop_id']
+            rects = list(rects or [])
+            if triggered == 'clear-mask.n_clicks':
+                rects = []
+            elif selected is not None and 'range' in selected:
+                # selection is in coordinates of the down-sampled image
+                step = self._image_step
+                (x0, x1), (y0, y1) = selected['range']['x'], \
+                    selected['range']['y']
+                rects.append([int(min(x0, x1) * step),
+                              int(max(x0, x1) * step),
+                              int(min(y0, y1) * step),
+                              int(max(y0, y1) * step)])
+            else:
+                raise dash.exceptions.PreventUpdate
+            return rects, f"{len(rects)} drawn mask(s)"
+
+        @self._app.callback(Output('logger', 'children'),
+                            [Input('analysis-type', 'value'),
+                             Input('energy', 'value'),
+                             Input('distance', 'value'),
+                             Input('pixel-size', 'value'),
+                             Input('centrex', 'value'),
+                             Input('centrey', 'value'),
+                             Input('int-mthd', 'value'),
+                             Input('int-pts', 'value'),
+                             Input('azim-pts', 'value'),
+                             Input('cake-pulses', 'value'),
+                             Input('xpcs-rings', 'value'),
+                             Input('int-rng', 'value'),
+                             Input('mask-rng', 'value'),
+                             Input('sparse-threshold', 'value'),
+                             Input('geom-file', 'value'),
+                             Input('mask-file', 'value'),
+                             Input('edge-mask', 'value'),
+                             Input('mask-rects', 'data'),
+                             Input('source', 'value'),
+                             Input('avg-mode', 'value'),
+                             Input('avg-window', 'value'),
+                             Input('slow-source', 'value'),
+                             Input('slow-prop', 'value'),
+                             Input('corr-min', 'value'),
+                             Input('corr-max', 'value'),
+                             Input('corr-bins', 'value'),
+                             Input('pp-on', 'value'),
+                             Input('pp-off', 'value')])
+        def update_params(analysis_type,
                           energy,
                           distance,
                           pixel_size,
@@ -225,11 +446,43 @@ class DashApp:
                           centery,
                           int_mthd,
                           int_pts,
+                          azim_pts,
+                          cake_pulses,
+                          xpcs_rings,
                           int_rng,
                           mask_rng,
+                          sparse_threshold,
                           geom_file,
-                          source):
-            self.processor.onAnalysisTypeChange(analysis_type)
+                          mask_file,
+                          edge_mask,
+                          mask_rects,
+                          source,
+                          avg_mode,
+                          avg_window,
+                          slow_source,
+                          slow_prop,
+                          corr_min,
+                          corr_max,
+                          corr_bins,
+                          pp_on,
+                          pp_off):
+            # only the parameters of the controls changed by a viewer are
+            # applied, so that viewers do not override each other
+            triggered = {t['prop_id'].split('.')[0]
+                         for t in dash.callback_context.triggered}
+            if '' in triggered:
+                # initial call, the controls of a new viewer show the
+                # defaults rather than the parameters in use
+                if self._params_applied:
+                    raise dash.exceptions.PreventUpdate
+                triggered = None
+            self._params_applied = True
+
+            def changed(*ids):
+                return triggered is None or not triggered.isdisjoint(ids)
+
+            if changed('analysis-type'):
+                self.processor.onAnalysisTypeChange(analysis_type)
             ai_params = dict(
                 energy=energy,
                 distance=distance,
@@ -238,20 +491,154 @@ class DashApp:
                 centery=centery,
                 int_mthd=int_mthd,
                 int_pts=int_pts,
+                azim_pts=azim_pts,
+                cake_pulses=cake_pulses,
+                xpcs_rings=xpcs_rings,
                 int_rng=int_rng,
                 mask_rng=mask_rng
             )
-            self.processor.onAiParamsChange(ai_params)
-            self.processor.onSourceNameChange(source)
-            self.processor.onGeomFileChange(geom_file)
+            if changed('energy', 'distance', 'pixel-size', 'centrex',
+                       'centrey', 'int-mthd', 'int-pts', 'azim-pts',
+                       'cake-pulses', 'xpcs-rings', 'int-rng', 'mask-rng'):
+                self.processor.onAiParamsChange(ai_params)
+            if changed('source'):
+                self.processor.onSourceNameChange(source)
+            if changed('sparse-threshold'):
+                self.processor.onSparseChange(sparse_threshold)
+            if changed('geom-file'):
+                self.processor.onGeomFileChange(geom_file)
+            if changed('mask-file', 'edge-mask', 'mask-rects'):
+                self.processor.onMaskChange(
+                    mask_file, 'edges' in (edge_mask or []), mask_rects)
+            if changed('avg-mode', 'avg-window'):
+                self.processor.onAveragingChange(avg_mode, avg_window)
+            if changed('slow-source', 'slow-prop', 'corr-min', 'corr-max',
+                       'corr-bins'):
+                self.processor.onCorrelationChange(
+                    slow_source, slow_prop, corr_min, corr_max, corr_bins)
+            if changed('pp-on', 'pp-off'):
+                self.processor.onPumpProbeChange(pp_on, pp_off)
 
             return f"{analysis_type} registered"
 
-    def _update(self):
+    def _snapshot(self, tid):
+        """Return the processed data shown by a viewer."""
         try:
-            self._data = self._proc_queue.get_nowait()
-        except queue.Empty:
-            self._data = None
+            snapshot = self._notifier.get(int(tid))
+        except (TypeError, ValueError):
+            snapshot = None
+        if snapshot is None:
+            # evicted, e.g. with less history when memory runs low: the
+            # latest train, with all panels as it may follow any train
+            data, _ = self._notifier.latest
+            if data is None:
+                raise dash.exceptions.PreventUpdate
+            snapshot = data, list(PANELS)
+        return snapshot
+
+    def _unchanged(self, panel, panels):
+        """Whether a new train left the data of the panel unchanged."""
+        triggered = [t['prop_id'] for t in dash.callback_context.triggered]
+        return triggered == ['train-id.value'] and panel not in panels
+
+    def _render_integral(self, data, analysis_type, projection, pulses,
+                         color_scale):
+        if analysis_type == "ROI":
+            try:
+                y = getattr(data, f"{projection}")
+                traces = [go.Scatter(
+                    x=np.arange(y.shape[1]), y=y[i]) for i in range(
+                        y[:pulses, ...].shape[0])]
+                y_avg = getattr(data, f"{projection}_avg")
+                if y_avg is not None:
+                    traces.append(go.Scatter(
+                        x=np.arange(y_avg.shape[0]), y=y_avg,
+                        line=dict(color='black', width=3)))
+            except Exception:
+                raise dash.exceptions.PreventUpdate
+        elif analysis_type == "AzimuthalIntegration":
+            try:
+                y = getattr(data, "intensities")
+                x = getattr(data, "momentum")
+                traces = [go.Scatter(x=x, y=y[i])
+                          for i in range(y[:pulses, ...].shape[0])]
+                if data.intensities_avg is not None:
+                    traces.append(go.Scatter(
+                        x=x, y=data.intensities_avg,
+                        line=dict(color='black', width=3)))
+            except Exception as ex:
+                raise dash.exceptions.PreventUpdate
+        elif analysis_type == "AzimuthalIntegration2D":
+            cake = data.cake
+            if data.cake_avg is not None:
+                cake = data.cake_avg
+            if cake is None:
+                raise dash.exceptions.PreventUpdate
+            traces = [go.Heatmap(z=cake,
+                                 x=data.momentum,
+                                 y=data.azimuthal,
+                                 colorscale=color_scale)]
+            return {
+                'data': traces,
+                'layout': go.Layout(
+                    xaxis={'title': 'q'},
+                    yaxis={'title': 'chi'},
+                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10})}
+        elif analysis_type == "XPCS":
+            if data.g2_pulses is None:
+                raise dash.exceptions.PreventUpdate
+            # g2 of the pulses on the left, of the trains on the right
+            traces = []
+            for axis, tau, g2 in [('x', data.tau_pulses, data.g2_pulses),
+                                  ('x2', data.tau_trains, data.g2_trains)]:
+                if g2 is None:
+                    continue
+                traces.extend(go.Scatter(
+                    x=tau, y=g2[i], mode='lines+markers',
+                    name=f"q = {q:.2f}", xaxis=axis,
+                    yaxis=axis.replace('x', 'y'))
+                    for i, q in enumerate(data.momentum))
+            return {
+                'data': traces,
+                'layout': go.Layout(
+                    xaxis={'title': 'tau (pulses)', 'type': 'log',
+                           'domain': [0, 0.48]},
+                    xaxis2={'title': 'tau (trains)', 'type': 'log',
+                            'domain': [0.52, 1]},
+                    yaxis={'title': 'g2'},
+                    yaxis2={'anchor': 'x2'},
+                    margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                    hovermode='closest',
+                    showlegend=False)}
+        else:
+            raise dash.exceptions.PreventUpdate
+
+        return {
+            'data': traces,
+            'layout': go.Layout(
+                xaxis={'title': 'q'},
+                yaxis={'title': 'I(q)'},
+                margin={'l': 40, 'b': 40, 't': 40, 'r': 10},
+                hovermode='closest',
+                showlegend=False)}
+
+    # per memory degradation level: (image down-sampling, cached
+    # figures, trains kept for the viewers)
+    DEGRADATION = [(3, 64, 5), (6, 32, 3), (12, 16, 2), (24, 8, 1)]
+
+    def onMemoryLevelChange(self, level):
+        step, figures, history = self.DEGRADATION[level]
+        self._image_step = step
+        self._render_cache.set_maxsize(figures)
+        self._notifier.set_history(history)
+
+    def _consume(self):
+        while True:
+            try:
+                data = self._proc_queue.get(timeout=config["TIME_OUT"])
+            except queue.Empty:
+                continue
+            self._notifier.publish(data)
 
     def recieve(self):
         self.reciever.daemon = True
@@ -260,3 +647,8 @@ class DashApp:
     def process(self):
         self.processor.daemon = True
         self.processor.start()
+        Thread(target=self._consume, daemon=True).start()
+        if self._governor is not None:
+            self._governor.start()
+        for node in self._nodes:
+            node.start()
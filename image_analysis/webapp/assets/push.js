@@ -0,0 +1,26 @@
+/* Push mode: update the dashboard when the server announces new
+   processed data, instead of polling it with an interval. */
+(function () {
+    function connect(trigger) {
+        var source = new EventSource(trigger.getAttribute('data-url'));
+        source.onmessage = function (event) {
+            // a train which changed none of the panels, e.g. without
+            // data, is not rendered
+            if (JSON.parse(event.data).panels.length > 0) {
+                trigger.click();
+            }
+        };
+    }
+
+    // the layout is rendered by Dash after the page is loaded
+    var poll = setInterval(function () {
+        var trigger = document.getElementById('push-trigger');
+        if (trigger === null) {
+            return;
+        }
+        clearInterval(poll);
+        if (trigger.getAttribute('data-push') === 'on') {
+            connect(trigger);
+        }
+    }, 200);
+})();
@@ -0,0 +1,51 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class RenderCache:
+    """Figures shared by all viewers.
+
+    Figures are keyed by (panel, train ID, view options) and rendered
+    only once, however many viewers ask for them at the same time.
+    """
+    def __init__(self, maxsize=64):
+        self._maxsize = maxsize
+        self._figures = OrderedDict()
+        self._pending = {}
+        self._lock = Lock()
+
+    def set_maxsize(self, maxsize):
+        with self._lock:
+            self._maxsize = maxsize
+            while len(self._figures) > self._maxsize:
+                self._figures.popitem(last=False)
+
+    def get(self, key, render):
+        """Return the cached figure, or the one returned by `render`."""
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                return self._figures[key]
+            pending = self._pending.setdefault(key, Lock())
+
+        with pending:
+            with self._lock:
+                if key in self._figures:
+                    return self._figures[key]
+            try:
+                figure = render()
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+
+            with self._lock:
+                self._figures[key] = figure
+                while len(self._figures) > self._maxsize:
+                    self._figures.popitem(last=False)
+        return figure
@@ -1,11 +1,19 @@
 from .config import config
 from .data_acquisition import DaqWorker
 from .data_processor import DataProcessorWorker, ProcessedData
+from .distributed import DistributedDataProcessor, ProcessingNode, run_node
 from .file_server import FileServer
+from .governor import MemoryGovernor
+from .parallel import ParallelDataProcessor
 
 __all__ = [
     'DaqWorker',
     'DataProcessorWorker',
+    'DistributedDataProcessor',
     'ProcessedData',
     'FileServer',
+    'MemoryGovernor',
+    'ParallelDataProcessor',
+    'ProcessingNode',
+    'run_node',
 ]
@@ -0,0 +1,164 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import numpy as np
+
+
+class RollingAverage:
+    """Moving average over the last `window` samples.
+
+    Samples are kept in a preallocated ring buffer together with their
+    running sum, so that an update costs O(1) regardless of the window.
+    """
+    def __init__(self, window):
+        self._window = max(int(window), 1)
+        self._buffer = None
+        self._sum = None
+        self._index = 0
+        self._count = 0
+
+    def _allocate(self, shape):
+        self._buffer = np.zeros((self._window,) + shape, dtype=np.float64)
+        self._sum = np.zeros(shape, dtype=np.float64)
+        self._index = 0
+        self._count = 0
+
+    def update(self, value):
+        value = np.asarray(value)
+        if self._buffer is None or self._buffer.shape[1:] != value.shape:
+            self._allocate(value.shape)
+
+        slot = self._buffer[self._index]
+        if self._count == self._window:
+            self._sum -= slot
+        else:
+            self._count += 1
+        slot[...] = value
+        self._sum += slot
+        self._index = (self._index + 1) % self._window
+
+        return self.value
+
+    @property
+    def value(self):
+        if self._count == 0:
+            return None
+        return self._sum / self._count
+
+    @property
+    def count(self):
+        return self._count
+
+
+class ExponentialAverage:
+    """Exponential moving average with smoothing 2 / (window + 1)."""
+    def __init__(self, window):
+        self._alpha = 2. / (max(int(window), 1) + 1)
+        self._value = None
+        self._count = 0
+
+    def update(self, value):
+        value = np.asarray(value)
+        if self._value is None or self._value.shape != value.shape:
+            self._value = value.astype(np.float64)
+            self._count = 1
+        else:
+            self._value *= 1. - self._alpha
+            self._value += self._alpha * value
+            self._count += 1
+
+        return self.value
+
+    @property
+    def value(self):
+        if self._value is None:
+            return None
+        return self._value.copy()
+
+    @property
+    def count(self):
+        return self._count
+
+
+class CumulativeAverage:
+    """Average over all samples since the last reset."""
+    def __init__(self):
+        self._sum = None
+        self._count = 0
+
+    def update(self, value):
+        value = np.asarray(value)
+        if self._sum is None or self._sum.shape != value.shape:
+            self._sum = value.astype(np.float64)
+            self._count = 1
+        else:
+            self._sum += value
+            self._count += 1
+
+        return self.value
+
+    @property
+    def value(self):
+        if self._count == 0:
+            return None
+        return self._sum / self._count
+
+    @property
+    def count(self):
+        return self._count
+
+
+def make_accumulator(mode, window):
+    """Return accumulator for the averaging mode selected in the UI.
+
+    :param str mode: one of "Rolling", "Exponential".
+    :param int window: number of trains.
+    """
+    if mode == "Rolling":
+        return RollingAverage(window)
+    elif mode == "Exponential":
+        return ExponentialAverage(window)
+    raise ValueError(f"Unknown averaging mode: {mode}")
+
+
+class OnlineBinner:
+    """Bin values against a scalar, e.g. FOMs against a motor position.
+
+    Sum, sum of squares and count of every bin are kept in preallocated
+    arrays, so that an update does not depend on the number of trains
+    already binned.
+    """
+    def __init__(self, v_min, v_max, n_bins):
+        self._edges = np.linspace(v_min, v_max, int(n_bins) + 1)
+        self._sum = np.zeros(int(n_bins))
+        self._sum2 = np.zeros(int(n_bins))
+        self._count = np.zeros(int(n_bins), dtype=np.int64)
+
+    def update(self, x, values):
+        """Add values measured at x.
+
+        :return: False if x is outside of the range.
+        """
+        index = np.searchsorted(self._edges, x, side='right') - 1
+        if x == self._edges[-1]:
+            index -= 1
+        if index < 0 or index >= len(self._count):
+            return False
+
+        values = np.asarray(values, dtype=np.float64)
+        self._sum[index] += values.sum()
+        self._sum2[index] += np.square(values).sum()
+        self._count[index] += values.size
+        return True
+
+    def statistics(self):
+        """Return bin centers, mean, standard deviation and count."""
+        centers = (self._edges[1:] + self._edges[:-1]) / 2.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = self._sum / self._count
+            var = self._sum2 / self._count - mean**2
+        std = np.sqrt(np.clip(var, 0, None))
+        return centers, mean, std, self._count.copy()
@@ -0,0 +1,102 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import hashlib
+import os
+import os.path as osp
+import tempfile
+
+import numpy as np
+
+from .config import config
+
+_file_hashes = {}
+
+
+def file_hash(filename):
+    """Return the SHA1 of the content of a file.
+
+    Hashes are kept in memory as long as size and mtime do not change.
+    """
+    stat = os.stat(filename)
+    key = (osp.abspath(filename), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        sha1 = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+        _file_hashes[key] = sha1.hexdigest()
+    return _file_hashes[key]
+
+
+def array_hash(array):
+    return hashlib.sha1(np.ascontiguousarray(array).view(np.uint8)).hexdigest()
+
+
+class WarmCache:
+    """Persistent cache of arrays which are expensive to compute.
+
+    Entries are .npz files named after the SHA1 of their key, so that
+    e.g. pixel maps and integration matrices survive restarts. Beyond
+    `max_mbytes`, the least recently used entries are removed.
+    """
+    def __init__(self, directory=None, max_mbytes=None):
+        if directory is None:
+            directory = config["CACHE_DIR"]
+        if max_mbytes is None:
+            max_mbytes = config["CACHE_MAX_MB"]
+        self._directory = directory
+        self._max_bytes = max_mbytes * 1024**2
+
+    def _path(self, name, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return osp.join(self._directory, f"{name}-{digest}.npz")
+
+    def load(self, name, key):
+        """Return the dict of arrays stored with `save`, or None."""
+        path = self._path(name, key)
+        if not osp.isfile(path):
+            return
+        try:
+            with np.load(path) as f:
+                arrays = {k: f[k] for k in f.files}
+            # the modification time orders the entries by last use
+            os.utime(path)
+            return arrays
+        except Exception as ex:
+            print(repr(ex))
+
+    def save(self, name, key, **arrays):
+        """Store arrays, errors are reported but not raised."""
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self._directory, suffix=".npz")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            # atomic, concurrent workers may write the same entry
+            os.replace(tmp, self._path(name, key))
+            self._prune()
+        except Exception as ex:
+            print(repr(ex))
+
+    def _prune(self):
+        """Remove the least recently used entries beyond the size cap."""
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.is_file() and entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by a concurrent worker
+                pass
+            total -= size
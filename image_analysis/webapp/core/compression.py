@@ -0,0 +1,225 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import pickle
+import time
+import zlib
+
+import numpy as np
+import zmq
+
+try:
+    import blosc
+except ImportError:
+    blosc = None
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+# in order of preference
+CODECS = ["blosc", "lz4", "zlib"]
+# smaller arrays are sent uncompressed with the train metadata
+MIN_SIZE = 1024
+
+
+def available_codecs():
+    modules = dict(blosc=blosc, lz4=lz4, zlib=zlib)
+    return [name for name in CODECS if modules[name] is not None]
+
+
+def resolve_codec(name):
+    """Return the available codec closest to a compression setting.
+
+    :param str name: "auto" or one of CODECS.
+    """
+    if name == "auto":
+        return available_codecs()[0]
+    if name not in CODECS:
+        raise ValueError(f"Unknown compression: {name}")
+    if name not in available_codecs():
+        print(f"{name} is not installed, falling back to zlib")
+        return "zlib"
+    return name
+
+
+def shuffle(array):
+    """Group the bytes of the items of an array by significance.
+
+    The high bytes of neighbouring pixels are mostly equal and compress
+    much better once grouped.
+    """
+    itemsize = array.dtype.itemsize
+    raw = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    return raw.reshape(-1, itemsize).T.tobytes()
+
+
+def unshuffle(buffer, out):
+    """Reverse `shuffle` into a preallocated array."""
+    itemsize = out.dtype.itemsize
+    out.reshape(-1).view(np.uint8).reshape(-1, itemsize)[:] = \
+        np.frombuffer(buffer, dtype=np.uint8).reshape(itemsize, -1).T
+
+
+class ArrayCodec:
+    """Compress arrays with byte shuffle.
+
+    blosc shuffles internally, lz4 (fast mode) and zlib are applied to
+    the output of `shuffle`.
+    """
+    def __init__(self, name, level=5):
+        if name not in available_codecs():
+            raise ValueError(f"Compression {name} is not available")
+        self.name = name
+        self._level = level
+
+    def compress(self, array):
+        array = np.ascontiguousarray(array)
+        if self.name == "blosc":
+            return blosc.compress_ptr(
+                array.__array_interface__['data'][0], array.size,
+                typesize=array.dtype.itemsize, clevel=self._level,
+                shuffle=blosc.SHUFFLE, cname="lz4")
+        if self.name == "lz4":
+            return lz4.compress(shuffle(array))
+        return zlib.compress(shuffle(array), self._level)
+
+    def decompress(self, buffer, out):
+        """Decompress into the C-contiguous array `out`."""
+        if self.name == "blosc":
+            blosc.decompress_ptr(buffer, out.__array_interface__['data'][0])
+        elif self.name == "lz4":
+            unshuffle(lz4.decompress(buffer), out)
+        else:
+            unshuffle(zlib.decompress(buffer), out)
+
+
+def send_train(socket, data, meta, codec):
+    """Send a train with its large arrays compressed.
+
+    The first frame holds the metadata, the small values and the
+    description of the arrays, followed by one frame per array.
+    """
+    if meta is None:
+        meta = {src: values.get("metadata", {})
+                for src, values in data.items()}
+
+    t0 = time.perf_counter()
+    header = dict(meta=meta, data={}, arrays=[], codec=codec.name)
+    frames = []
+    for src, values in data.items():
+        header["data"][src] = {}
+        for key, value in values.items():
+            if isinstance(value, np.ndarray) and value.nbytes >= MIN_SIZE:
+                header["arrays"].append(
+                    (src, key, value.dtype.str, value.shape))
+                frames.append(codec.compress(value))
+            else:
+                header["data"][src][key] = value
+    header["compress_time"] = time.perf_counter() - t0
+    socket.send_multipart([pickle.dumps(header)] + frames, copy=False)
+
+
+class CompressedStreamer:
+    """Stream trains through a PUSH socket, compressing the arrays.
+
+    Drop-in replacement of karabo_data's ZMQStreamer in `serve_files`,
+    the trains are received with `CompressedClient`.
+    """
+    def __init__(self, port, compression="auto", maxlen=10):
+        self._codec = ArrayCodec(resolve_codec(compression))
+        self._port = port
+        self._maxlen = maxlen
+        self._socket = None
+
+    def start(self):
+        self._socket = zmq.Context.instance().socket(zmq.PUSH)
+        self._socket.setsockopt(zmq.SNDHWM, self._maxlen)
+        self._socket.bind(f"tcp://*:{self._port}")
+
+    def feed(self, data, metadata=None):
+        send_train(self._socket, data, metadata, self._codec)
+
+    def stop(self):
+        self._socket.close(linger=0)
+
+
+class CompressedClient:
+    """Receive the trains sent by `CompressedStreamer`.
+
+    Arrays are decompressed into a ring of preallocated buffers, hence
+    the data returned by `next` is overwritten after `n_buffers` trains.
+    `n_buffers` must exceed the number of trains held anywhere by the
+    consumers, which copy the arrays of trains they keep longer.
+    """
+    def __init__(self, endpoint, n_buffers=4):
+        self._endpoint = endpoint
+        self._socket = None
+        self._codecs = {}
+        self._buffers = [{} for _ in range(n_buffers)]
+        self._index = 0
+
+        self._codec = None
+        self._n_trains = 0
+        self._raw_bytes = 0
+        self._compressed_bytes = 0
+        self._compress_time = 0.
+        self._decompress_time = 0.
+
+    def __enter__(self):
+        self._socket = zmq.Context.instance().socket(zmq.PULL)
+        self._socket.setsockopt(zmq.RCVHWM, 2)
+        self._socket.connect(self._endpoint)
+        return self
+
+    def __exit__(self, *exc):
+        self._socket.close(linger=0)
+
+    def next(self):
+        """Return the (data, metadata) of the next train.
+
+        The arrays are only valid until the ring wraps, i.e. for the
+        next `n_buffers - 1` calls.
+        """
+        frames = self._socket.recv_multipart(copy=False)
+        header = pickle.loads(frames[0].bytes)
+        self._codec = header["codec"]
+        codec = self._codecs.get(self._codec)
+        if codec is None:
+            codec = self._codecs[self._codec] = ArrayCodec(self._codec)
+
+        buffers = self._buffers[self._index]
+        self._index = (self._index + 1) % len(self._buffers)
+
+        data = header["data"]
+        t0 = time.perf_counter()
+        for (src, key, dtype, shape), frame in zip(
+                header["arrays"], frames[1:]):
+            out = buffers.get((src, key))
+            if out is None or out.shape != shape or out.dtype != dtype:
+                out = buffers[(src, key)] = np.empty(shape, dtype=dtype)
+            codec.decompress(frame.buffer, out)
+            data[src][key] = out
+            self._raw_bytes += out.nbytes
+            self._compressed_bytes += len(frame)
+        self._decompress_time += time.perf_counter() - t0
+        self._compress_time += header["compress_time"]
+        self._n_trains += 1
+        return data, header["meta"]
+
+    def stats(self):
+        """Return the codec, compression ratio and the compression and
+        decompression times per train in ms."""
+        n = max(self._n_trains, 1)
+        ratio = 0.
+        if self._compressed_bytes > 0:
+            ratio = self._raw_bytes / self._compressed_bytes
+        return dict(codec=self._codec,
+                    trains=self._n_trains,
+                    ratio=ratio,
+                    compress_ms=1e3 * self._compress_time / n,
+                    decompress_ms=1e3 * self._decompress_time / n)
@@ -13,9 +13,21 @@ config = {
         int_rng=[0.2, 5],
         int_mthds = ['BBox', 'numpy', 'cython', 'splitpixel', 'csr', 'lut'],
         int_pts=512,
+        azim_pts=360,
+        # pulse pattern of the pulses of which the cakes are computed
+        cake_pulses="0:10",
+        xpcs_rings=10,
+        precision="float32",
+        # stream compression between FileServer and DaqWorker:
+        # None, "auto", "blosc", "lz4" or "zlib"
+        compression=None,
+        # analyse the pixels above threshold as sparse photon events,
+        # for low occupancy; None analyses the dense frames
+        sparse_threshold=None,
         quad_positions=[(-11.4, -299), (11.5, -8),
                         (-254.5, 16), (-278.5, -275)],
         geom_file='',
+        mask_file='',
         run_folder='/Users/ebadkamil/jungfraudata',
         port=45454,
         ),
@@ -31,14 +43,33 @@ config = {
         int_rng=[0.2, 5],
         int_mthds = ['BBox', 'numpy', 'cython', 'splitpixel', 'csr', 'lut'],
         int_pts=512,
+        azim_pts=360,
+        # pulse pattern of the pulses of which the cakes are computed
+        cake_pulses="0:10",
+        xpcs_rings=10,
+        precision="float32",
+        compression=None,
+        sparse_threshold=None,
         quad_positions=[[11.4, 299],
                         [-11.5, 8],
                         [254.5, -16],
                         [278.5, 275]],
         geom_file=osp.join(osp.dirname(osp.dirname(osp.abspath(__file__))),
                                       'geometry/lpd_mar_18_axesfixed.h5'),
+        mask_file='',
         run_folder='/Users/ebadkamil/fxe-data',
         port=45454),
 
     "TIME_OUT":1.,
+    # trains waiting for their parts from several endpoints, and the
+    # seconds after which they are processed incomplete
+    "MATCH_WINDOW":10,
+    "MATCH_TIMEOUT":1.,
+    # memory budget of the process in GB, no limit if None
+    "MEMORY_BUDGET":None,
+    "CACHE_DIR":osp.join(osp.expanduser("~"), ".cache", "image_analysis"),
+    # least recently used entries are removed beyond this size in MB
+    "CACHE_MAX_MB":1024,
+    "DISPATCH_PORT":45460,
+    "COLLECT_PORT":45461,
     }
\ No newline at end of file
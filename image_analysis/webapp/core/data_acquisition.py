@@ -9,24 +9,94 @@ from threading import Thread, Event
 
 from karabo_bridge import Client
 
+from .compression import CompressedClient
+from .config import config
+from .matcher import TrainMatcher
+
 
 class DaqWorker(Thread):
-    def __init__(self, hostname, port, daq_queue):
+    def __init__(self, hostname, port, daq_queue, compression=None):
+        """Initialization.
+
+        :param str port: port, or comma separated ports of several
+            endpoints streaming parts of the trains, e.g. the receivers
+            of a detector, which are merged by train ID.
+        :param str compression: receive the compressed stream of a
+            FileServer started with compression, see CompressedClient.
+        """
         super().__init__()
 
         self._daq_queue = daq_queue
         self._running = False
-        self._bind_address = f"tcp://{hostname}:{port}"
+        self._endpoints = [f"tcp://{hostname}:{p.strip()}"
+                           for p in str(port).split(",")]
+        self._compression = compression
+        self._clients = []
+        self._matcher = None
 
     def run(self):
         self._running = True
-        with Client(self._bind_address) as client:
+        n_clients = len(self._endpoints)
+        parts_size = 2 * n_clients
+        window = config["MATCH_WINDOW"]
+        # trains of a client which may still be in use while it receives
+        # the next one: being processed, in the data queue and blocked in
+        # put, and if merged, also in the parts queue and the matcher
+        n_buffers = 4
+        if n_clients > 1:
+            n_buffers += parts_size + window + 1
+        self._clients = [
+            CompressedClient(endpoint, n_buffers=n_buffers + 1)
+            if self._compression else Client(endpoint)
+            for endpoint in self._endpoints]
+        if n_clients == 1:
+            self._receive(self._clients[0], self._put)
+            return
+
+        self._matcher = TrainMatcher(
+            range(n_clients), window=window,
+            timeout=config["MATCH_TIMEOUT"])
+        parts = queue.Queue(maxsize=parts_size)
+        for i, client in enumerate(self._clients):
+            Thread(target=self._receive, daemon=True,
+                   args=(client, lambda data, i=i: parts.put((i, data)))
+                   ).start()
+
+        while self._running:
+            try:
+                part, (data, meta) = parts.get(timeout=config["TIME_OUT"])
+            except queue.Empty:
+                released = self._matcher.expire()
+            else:
+                tid = next(iter(meta.values()))["timestamp.tid"]
+                released = self._matcher.push(part, tid, data, meta)
+                released += self._matcher.expire()
+            for train in released:
+                self._put(train)
+
+    def _receive(self, client, put):
+        with client:
             while self._running:
-                data = client.next()
-                try:
-                    self._daq_queue.put(data)
-                except queue.Full:
-                    continue
+                put(client.next())
+
+    def _put(self, data):
+        try:
+            self._daq_queue.put(data)
+        except queue.Full:
+            pass
+
+    def stats(self):
+        """Compression statistics of the (first) stream, or None."""
+        if not self._clients \
+                or not isinstance(self._clients[0], CompressedClient):
+            return None
+        return self._clients[0].stats()
+
+    def matcher_stats(self):
+        """Counters of the trains merged from several endpoints, or None."""
+        if self._matcher is None:
+            return None
+        return self._matcher.stats()
 
     def terminate(self):
         self._running = False
@@ -9,17 +9,65 @@ from concurrent.futures import ThreadPoolExecutor
 import functools
 import numpy as np
 import queue
-from scipy import constants
-from threading import Thread, Event
-
-from karabo_data import stack_detector_data
-from karabo_data.geometry2 import LPD_1MGeometry, AGIPD_1MGeometry
-from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+from threading import Thread, Event, Lock
 
+from .accumulators import (
+    CumulativeAverage, OnlineBinner, make_accumulator)
+from .cache import WarmCache, array_hash, file_hash
 from .config import config
+from .masks import ASIC_SHAPES, MaskManager
+from .matcher import stack_sources
+from .sparse import SparseFrames
+from .transforms import CakeTransform, PixelMap, RadialBinMap
+from .xpcs import MultiTauCorrelator, QRings
+
+
+def _import_heavy_modules():
+    """Import the analysis dependencies ahead of the first train."""
+    import pyFAI.azimuthalIntegrator  # noqa
+    import scipy.sparse  # noqa
+
+
+def precision():
+    """Return the dtypes (storage, computation) of the detector images.
+
+    Images are stored in the precision configured for the detector,
+    reductions are computed in at least float32.
+    """
+    detector_config = config.get(config["DETECTOR"], {})
+    dtype = np.dtype(detector_config.get("precision", "float32"))
+    return dtype, np.result_type(dtype, np.float32)
+
+
+@functools.lru_cache(maxsize=16)
+def pulse_indices(pattern, n_pulses):
+    """Return the indices of the pulses selected by a pattern.
+
+    :param str pattern: slice, e.g. "0::2", or list, e.g. "0, 3, 5".
+    :param int n_pulses: number of pulses in the train.
+
+    :return: numpy.ndarray of indices.
+    """
+    pattern = pattern.strip()
+    if ':' in pattern:
+        bounds = [int(b) if b.strip() else None for b in pattern.split(':')]
+        if len(bounds) > 3:
+            raise ValueError(f"Invalid pulse pattern: {pattern}")
+        return np.arange(n_pulses)[slice(*bounds)]
+
+    indices = np.array([int(i) for i in pattern.split(',') if i.strip()],
+                       dtype=np.int64)
+    return indices[(indices >= 0) & (indices < n_pulses)]
 
 
 class DataProcessorWorker(Thread):
+    # limits per memory degradation level, see MemoryGovernor:
+    # (pulses, FOM history, averaging window, recorder queue)
+    DEGRADATION = [(None, 15, None, 100),
+                   (200, 10, 50, 50),
+                   (100, 5, 20, 20),
+                   (50, 3, 5, 5)]
+
     def __init__(self, in_queue, out_queue):
         super().__init__()
 
@@ -29,13 +77,53 @@ class DataProcessorWorker(Thread):
         self._analysis_type = None
         self._ai_params = None
         self._ai_integrator = None
+        # the integrator is also built ahead of the trains, see
+        # `_warm_integrator`
+        self._ai_lock = Lock()
+        self._image_shape = None
+        self._cake_transform = None
+        self._cake_key = None
+        self._radial_map = None
+        self._radial_key = None
+        self._sparse_threshold = None
+        self._q_rings = None
+        self._q_rings_key = None
+        self._hashed_mask = None
+        self._hashed_mask_key = None
+        self._pulse_range = None
+        # rings of the g2 accumulated over trains, and the correlators of
+        # the pulses and of the trains
+        self._xpcs_rings = None
+        self._xpcs_pulses = None
+        self._xpcs_trains = None
         self._geom_file = None
         self._geom = None
+        self._pixel_map = None
+        self._pixel_map_key = None
+        self._cache = WarmCache()
+        self._masks = MaskManager()
         self._source_name = None
         self._fom = deque(maxlen=15)
+        self._avg_mode = None
+        self._avg_window = 1
+        self._accumulators = {}
+        self._recorder = None
+        self._slow_source = None
+        self._slow_prop = None
+        self._corr_params = None
+        self._binner = None
+        self._correlation = None
+        self._pp_patterns = None
+        self._pp_accumulators = {}
+        self._max_pulses = None
+        self._max_avg_window = None
+        # set by the governor thread, applied by `_post_process`
+        self._memory_level = 0
+        self._pending_memory_level = 0
 
     def run(self):
         self._running = True
+        Thread(target=_import_heavy_modules, daemon=True).start()
         while self._running:
             try:
                 data, meta = self._in_queue.get(timeout=config["TIME_OUT"])
@@ -43,36 +131,184 @@ class DataProcessorWorker(Thread):
                 continue
 
             tid = next(iter(meta.values()))["timestamp.tid"]
-            proc_data = ProcessedData(tid)
-
-            assembled = self.assemble(data, proc_data)
-            if assembled is not None and assembled.shape[0] != 0:
-                if self._ai_params is not None:
-                    threshold_mask = self._ai_params["mask_rng"]
-                self.mask_image(assembled, threshold_mask=threshold_mask)
-                mean_image = np.mean(assembled, axis=0)
-                proc_data.image = mean_image
-                self._process(self._analysis_type, assembled, proc_data)
-
-            while self._running:
-                try:
-                    self._out_queue.put(proc_data, timeout=config["TIME_OUT"])
-                    break
-                except queue.Full:
-                    continue
+            proc_data = self.process_train(
+                tid, self.assemble(data), self.slow_value(data))
+            self._post_process(proc_data)
+            self._put(proc_data)
+
+    def _put(self, proc_data):
+        while self._running:
+            try:
+                self._out_queue.put(proc_data, timeout=config["TIME_OUT"])
+                break
+            except queue.Full:
+                continue
+
+    def process_train(self, tid, assembled, slow_value=None,
+                      pulse_range=None):
+        """Process the assembled images of a single train.
+
+        Only depends on the current parameters, not on previous trains,
+        so that trains can be processed independently of each other.
+
+        :param tuple pulse_range: (first pulse, pulses of the train) if
+            the images are a pulse range of the train.
+        """
+        self._pulse_range = pulse_range
+        proc_data = ProcessedData(tid)
+        proc_data.slow_value = slow_value
+        if assembled is not None and assembled.shape[0] != 0:
+            threshold_mask = None
+            if self._ai_params is not None:
+                threshold_mask = self._ai_params["mask_rng"]
+            self._image_shape = assembled.shape[1:]
+            # missing modules are NaN, they are masked rather than
+            # averaged as zeros by `mask_image`
+            self._masks.set_missing(np.isnan(assembled[0]))
+            mask = self._masks.get(self._image_shape)
+            proc_data.mask = mask
+            proc_data.n_pulses = assembled.shape[0]
+            if self._sparse_threshold is not None:
+                # the analysis runs on the events, see SparseFrames
+                data = SparseFrames.from_dense(
+                    assembled, self._sparse_threshold, mask=mask,
+                    clip=threshold_mask)
+                proc_data.image = data.mean_image(precision()[1])
+                proc_data.occupancy = data.occupancy
+                # events are above the threshold, up to the clip maximum
+                value_range = None
+                if threshold_mask is not None \
+                        and threshold_mask[1] > self._sparse_threshold:
+                    value_range = (self._sparse_threshold,
+                                   threshold_mask[1])
+                proc_data.event_histogram = data.histogram(range=value_range)
+            else:
+                self.mask_image(assembled, threshold_mask=threshold_mask,
+                                mask=mask)
+                data = assembled
+                proc_data.image = np.mean(
+                    assembled, axis=0, dtype=precision()[1])
+            self._process(self._analysis_type, data, proc_data)
+            self.process_pump_probe(proc_data)
+        return proc_data
+
+    def _post_process(self, processed):
+        """Update the history that depends on trains order."""
+        level = self._pending_memory_level
+        if level != self._memory_level:
+            self._apply_memory_level(level)
+        if processed.foms is not None:
+            self._fom.append((processed.tid, processed.foms))
+            processed.fom = self._fom
+        self._correlate(processed)
+        self._accumulate(processed)
+        self._accumulate_pump_probe(processed)
+        self._accumulate_xpcs(processed)
+        if self._recorder is not None:
+            self._recorder.record(processed)
 
     def _process(self, analysis_type, data, processed):
         if analysis_type == "ROI":
             self.process_roi(data, processed)
         elif analysis_type == "AzimuthalIntegration":
             self.process_ai(data, processed)
+        elif analysis_type == "AzimuthalIntegration2D":
+            self.process_ai_2d(data, processed)
+        elif analysis_type == "XPCS":
+            self.process_xpcs(data, processed)
         else:
             pass
 
-    def mask_image(self, image, threshold_mask=None):
+    def process_pump_probe(self, processed):
+        """Average the curves of the pumped and unpumped pulses."""
+        if self._pp_patterns is None:
+            return
+        try:
+            on = pulse_indices(self._pp_patterns[0], processed.n_pulses)
+            off = pulse_indices(self._pp_patterns[1], processed.n_pulses)
+        except ValueError as ex:
+            print(ex)
+            return
+        if len(on) == 0 or len(off) == 0:
+            return
+
+        pump_probe = {}
+        for key in ["intensities", "projection_x", "projection_y"]:
+            values = getattr(processed, key)
+            if values is not None:
+                pump_probe[key] = (np.mean(values[on], axis=0),
+                                   np.mean(values[off], axis=0))
+        processed.pump_probe = pump_probe or None
+
+    def _accumulate_pump_probe(self, processed):
+        if processed.pump_probe is None:
+            return
+
+        pump_probe_avg = {}
+        for key, (on, off) in processed.pump_probe.items():
+            if key not in self._pp_accumulators:
+                self._pp_accumulators[key] = (
+                    CumulativeAverage(), CumulativeAverage())
+            acc_on, acc_off = self._pp_accumulators[key]
+            on_avg, off_avg = acc_on.update(on), acc_off.update(off)
+            pump_probe_avg[key] = (on_avg, off_avg, on_avg - off_avg)
+            processed.n_pump_probe = acc_on.count
+        processed.pump_probe_avg = pump_probe_avg
+
+    def slow_value(self, data):
+        """Return the selected slow property of a train, or None."""
+        if not (self._slow_source and self._slow_prop):
+            return
+        try:
+            return float(data[self._slow_source][self._slow_prop])
+        except (KeyError, TypeError, ValueError):
+            return
+
+    def _correlate(self, processed):
+        if self._corr_params is None or processed.foms is None \
+                or processed.slow_value is None:
+            return
+        if self._binner is None:
+            self._binner = OnlineBinner(*self._corr_params)
+            self._correlation = None
+        if self._binner.update(processed.slow_value, processed.foms) \
+                or self._correlation is None:
+            self._correlation = self._binner.statistics()
+        # the same object as long as unchanged, see push.changed_panels
+        processed.correlation = self._correlation
+
+    def _accumulate(self, processed):
+        # empty trains, e.g. source missing or task lost, are skipped
+        if self._avg_mode is None or processed.image is None:
+            return
+
+        averages = {"image": processed.image}
+        if processed.cake is not None:
+            averages["cake"] = processed.cake
+        if processed.intensities is not None:
+            averages["intensities"] = np.mean(processed.intensities, axis=0)
+        if processed.projection_x is not None:
+            averages["projection_x"] = np.mean(processed.projection_x, axis=0)
+        if processed.projection_y is not None:
+            averages["projection_y"] = np.mean(processed.projection_y, axis=0)
+
+        for key, value in averages.items():
+            accumulator = self._accumulators.get(key)
+            if accumulator is None:
+                window = self._avg_window
+                if self._max_avg_window is not None:
+                    window = min(window, self._max_avg_window)
+                accumulator = make_accumulator(self._avg_mode, window)
+                self._accumulators[key] = accumulator
+            setattr(processed, f"{key}_avg", accumulator.update(value))
+            processed.n_averaged = accumulator.count
+
+    def mask_image(self, image, threshold_mask=None, mask=None):
 
         def parallel(i):
             image[i][np.isnan(image[i])] = 0
+            if mask is not None:
+                image[i][mask] = 0
             if threshold_mask is not None:
                 a_min, a_max = threshold_mask
                 np.clip(image[i], a_min, a_max, out=image[i])
@@ -80,57 +316,156 @@ class DataProcessorWorker(Thread):
         with ThreadPoolExecutor(max_workers=5) as executor:
             executor.map(parallel, range(image.shape[0]))
 
-    def assemble(self, data, processed):
+    def assemble(self, data):
+        stacked = self.stack(data)
+        if stacked is None:
+            return
+        return self.assemble_stacked(stacked)
+
+    def stack(self, data):
+        """Extract the detector data of a train as a single array."""
+        stacked = self._stack(data)
+        if stacked is not None and self._max_pulses is not None:
+            stacked = stacked[:self._max_pulses]
+        return stacked
+
+    def _stack(self, data):
         if config["DETECTOR"] == "JungFrau":
-            try:
-                img = np.copy(data[self._source_name]["data.adc"])
-            except KeyError as ex:
-                print(ex)
-                return
-        elif config["DETECTOR"] == "LPD":
-            try:
-                modules_data = stack_detector_data(
-                    data, "image.data", only='LPD')
-            except Exception as ex:
-                print(ex)
+            sources = self._source_name
+            if isinstance(sources, str):
+                sources = [sources]
+            if not sources:
                 return
-            if self._geom is not None:
-                img, _ = self._geom.position_all_modules(modules_data)
-            else:
+            if len(sources) == 1:
+                try:
+                    return data[sources[0]]["data.adc"]
+                except KeyError as ex:
+                    print(ex)
+                    return
+            # modules of the receivers one below the other, missing
+            # modules are NaN and hence masked
+            stacked = stack_sources(data, sources, "data.adc")
+            if stacked is None:
+                print(f"None of {sources} in train")
                 return
-        elif config["DETECTOR"] == "AGIPD":
+            n_pulses, n_modules, rows, columns = stacked.shape
+            return stacked.reshape(n_pulses, n_modules * rows, columns)
+        elif config["DETECTOR"] in ["LPD", "AGIPD"]:
+            from karabo_data import stack_detector_data
             try:
-                modules_data = stack_detector_data(
-                    data, "image.data", only='AGIPD')
+                return stack_detector_data(
+                    data, "image.data", only=config["DETECTOR"])
             except Exception as ex:
                 print(ex)
                 return
-            if self._geom is not None:
-                img, _ = self._geom.position_all_modules(modules_data)
-            else:
-                return
         else:
             print("Unknown detector type")
             return
 
-        return img
+    def assemble_stacked(self, stacked, copy=True):
+        """Assemble the output of `stack` into images.
+
+        :param numpy.ndarray stacked: stacked detector data.
+        :param bool copy: JungFrau data is modified in place by the
+            processing unless it is copied.
+        """
+        dtype, _ = precision()
+        if config["DETECTOR"] == "JungFrau":
+            if self._sparse_threshold is not None:
+                # only read when thresholded into events
+                return stacked
+            if copy or stacked.dtype != dtype:
+                return stacked.astype(dtype)
+            return stacked
+        pixel_map = self._update_pixel_map(stacked.shape[1:])
+        if pixel_map is None:
+            return
+        return pixel_map(stacked, dtype=dtype)
+
+    def _update_pixel_map(self, modules_shape):
+        modules_shape = tuple(modules_shape)
+        if self._pixel_map is not None \
+                and self._pixel_map_key == modules_shape:
+            return self._pixel_map
+        if not self._geom_file:
+            return
+
+        try:
+            key = (config["DETECTOR"],
+                   file_hash(self._geom_file),
+                   repr(config[config["DETECTOR"]]["quad_positions"]),
+                   modules_shape)
+        except (OSError, KeyError) as ex:
+            print(repr(ex))
+            return
+        arrays = self._cache.load("pixel_map", key)
+        if arrays is not None:
+            pixel_map = PixelMap.from_arrays(arrays)
+        else:
+            geom = self._load_geometry()
+            if geom is None:
+                return
+            pixel_map = PixelMap.from_geometry(geom, modules_shape)
+            self._cache.save("pixel_map", key, **pixel_map.to_arrays())
+
+        self._masks.set_gap_mask(pixel_map.gap_mask)
+        self._masks.set_module_edges(pixel_map.edge_mask(
+            modules_shape, ASIC_SHAPES[config["DETECTOR"]]))
+        self._pixel_map = pixel_map
+        self._pixel_map_key = modules_shape
+        return pixel_map
+
+    def _load_geometry(self):
+        """Only needed if the pixel map is not in the warm cache."""
+        if self._geom is not None:
+            return self._geom
+
+        from karabo_data.geometry2 import LPD_1MGeometry, AGIPD_1MGeometry
+        try:
+            if config["DETECTOR"] == 'LPD':
+                quad_positions = config["LPD"]["quad_positions"]
+                self._geom = LPD_1MGeometry.from_h5_file_and_quad_positions(
+                    self._geom_file, quad_positions)
+            elif config["DETECTOR"] == 'AGIPD':
+                self._geom = AGIPD_1MGeometry.from_crystfel_geom(
+                    self._geom_file)
+        except Exception as ex:
+            print(ex)
+        return self._geom
 
     def process_roi(self, assembled, processed):
-        processed.projection_x = np.mean(assembled, axis=1)
-        processed.projection_y = np.mean(assembled, axis=2)
+        _, compute_dtype = precision()
+        if isinstance(assembled, SparseFrames):
+            processed.projection_x, processed.projection_y = \
+                assembled.projections(compute_dtype)
+            return
+        processed.projection_x = np.mean(assembled, axis=1, dtype=compute_dtype)
+        processed.projection_y = np.mean(assembled, axis=2, dtype=compute_dtype)
 
     def process_ai(self, assembled, processed):
+        if isinstance(assembled, SparseFrames):
+            bin_map = self._update_radial_map(
+                assembled.shape, processed.mask)
+            processed.momentum = bin_map.radial
+            processed.intensities = assembled.radial_profiles(bin_map)
+            processed.foms = self._foms(
+                processed.intensities, processed.momentum)
+            return
+
         integrator = self._update_integrator()
         itgt1d = functools.partial(integrator.integrate1d,
                                    method=self._ai_params["int_mthd"],
                                    radial_range=self._ai_params["int_rng"],
                                    correctSolidAngle=True,
                                    polarization_factor=1,
+                                   mask=processed.mask,
                                    unit="q_A^-1")
         integ_points = self._ai_params["int_pts"]
 
         def parallel(i):
-            ret = itgt1d(assembled[i], integ_points)
+            # pyFAI works in float32 anyway, avoids upcasting float16
+            ret = itgt1d(assembled[i].astype(np.float32, copy=False),
+                         integ_points)
             return ret.radial, ret.intensity
 
         with ThreadPoolExecutor(max_workers=5) as executor:
@@ -138,19 +473,198 @@ class DataProcessorWorker(Thread):
                                 range(assembled.shape[0]))
 
         momentums, intensities = zip(*rets)
-        momentum = momentums[0]
+        processed.momentum = momentums[0]
+        processed.intensities = np.array(intensities)
+        processed.foms = self._foms(
+            processed.intensities, processed.momentum)
+
+    def _foms(self, intensities, momentum):
+        """Integrals of the curves over the integration range."""
         foms = []
         for intensity in intensities:
             itgt = np.trapz(*slice_curve(
                 intensity, momentum, *self._ai_params["int_rng"]))
             foms.append(itgt)
+        return foms
+
+    def process_ai_2d(self, assembled, processed):
+        transform = self._update_cake_transform(
+            processed.image.shape, processed.mask)
+        processed.momentum = transform.radial
+        processed.azimuthal = transform.azimuthal
+        # the transform is linear, the cake of the mean image is the mean
+        # of the cakes of the pulses
+        processed.cake = transform(processed.image[np.newaxis])[0]
+
+        pulses = self._cake_pulses(processed.n_pulses)
+        if len(pulses) == 0:
+            return
+        if isinstance(assembled, SparseFrames):
+            images = assembled.to_dense(pulses)
+        else:
+            images = assembled[pulses]
+        processed.cakes = transform(images)
+        first, _ = self._pulse_range or (0, None)
+        processed.cake_pulses = pulses + first
+
+    def _cake_pulses(self, n_pulses):
+        """Return the indices of the pulses of which the cakes are
+        computed, in the images of the train or of its pulse range."""
+        pattern = self._ai_params.get("cake_pulses")
+        if not pattern:
+            return np.array([], dtype=np.int64)
+        first, n_train_pulses = self._pulse_range or (0, n_pulses)
+        try:
+            pulses = np.unique(pulse_indices(pattern, n_train_pulses)) - first
+        except ValueError as ex:
+            print(ex)
+            return np.array([], dtype=np.int64)
+        return pulses[(pulses >= 0) & (pulses < n_pulses)]
+
+    def process_xpcs(self, assembled, processed):
+        """Correlate the pulses of the train, per q ring."""
+        shape = assembled.shape if isinstance(assembled, SparseFrames) \
+            else assembled.shape[1:]
+        rings = self._update_q_rings(shape, processed.mask)
+        frames = rings.frames(assembled)
+        correlator = MultiTauCorrelator()
+        for frame in frames:
+            correlator.add(frame, rings)
+
+        processed.momentum = rings.radial
+        processed.xpcs_sums = correlator.sums
+        processed.xpcs_frame = frames.mean(axis=0)
+
+    def _accumulate_xpcs(self, processed):
+        """Sum the pulse correlations over trains and correlate the
+        trains with each other."""
+        if processed.xpcs_sums is None:
+            return
+        rings = self._update_q_rings(processed.image.shape, processed.mask)
+        if rings is not self._xpcs_rings:
+            self._xpcs_rings = rings
+            self._xpcs_pulses = MultiTauCorrelator()
+            self._xpcs_trains = MultiTauCorrelator()
+        if len(processed.xpcs_frame) != len(rings.pixels):
+            # processed with other parameters, during a change
+            return
+        self._xpcs_pulses.merge(processed.xpcs_sums)
+        self._xpcs_trains.add(processed.xpcs_frame, rings)
+        processed.tau_pulses, processed.g2_pulses = self._xpcs_pulses.g2()
+        processed.tau_trains, processed.g2_trains = self._xpcs_trains.g2()
 
-        self._fom.append((processed.tid, foms))
-        processed.momentum = momentum
-        processed.intensities = np.array(intensities)
-        processed.fom = self._fom
+    def _update_cake_transform(self, shape, mask=None):
+        integrator = self._update_integrator()
+        key = self._transform_key(shape, integrator) \
+            + (self._ai_params["azim_pts"],)
+        if self._cake_key != key:
+            self._cake_transform = self._cached_transform(
+                "cake", key, mask, CakeTransform,
+                lambda: CakeTransform(
+                    integrator, shape,
+                    self._ai_params["int_pts"],
+                    self._ai_params["azim_pts"],
+                    self._ai_params["int_rng"],
+                    mask=mask))
+            self._cake_key = key
+        return self._cake_transform
+
+    def _update_radial_map(self, shape, mask=None):
+        integrator = self._update_integrator()
+        key = self._transform_key(shape, integrator)
+        if self._radial_key != key:
+            self._radial_map = self._cached_transform(
+                "radial", key, mask, RadialBinMap,
+                lambda: RadialBinMap(
+                    integrator, shape,
+                    self._ai_params["int_pts"],
+                    self._ai_params["int_rng"],
+                    mask=mask))
+            self._radial_key = key
+        return self._radial_map
+
+    def _update_q_rings(self, shape, mask=None):
+        integrator = self._update_integrator()
+        n_rings = int(self._ai_params.get("xpcs_rings") or 10)
+        # with workers, the mask of a train may differ from the one of
+        # this process, e.g. the gap mask after a geometry change
+        key = self._transform_key(shape, integrator, self._mask_key(mask)) \
+            + ("rings", n_rings)
+        if self._q_rings_key != key:
+            bin_map = self._cached_transform(
+                "rings", key, mask, RadialBinMap,
+                lambda: RadialBinMap(
+                    integrator, shape, n_rings,
+                    self._ai_params["int_rng"], mask=mask))
+            self._q_rings = QRings(bin_map.index, bin_map.radial)
+            self._q_rings_key = key
+        return self._q_rings
+
+    def _mask_key(self, mask):
+        """Hash of a mask, computed once per mask array."""
+        if mask is None:
+            return None
+        if mask is not self._hashed_mask:
+            self._hashed_mask = mask
+            self._hashed_mask_key = array_hash(mask)
+        return self._hashed_mask_key
+
+    def _transform_key(self, shape, integrator, mask_key=None):
+        """:param mask_key: identifies the mask, by default the version
+            of the masks of this process."""
+        if mask_key is None:
+            mask_key = self._masks.version
+        return (tuple(shape),
+                mask_key,
+                integrator.dist,
+                integrator.poni1,
+                integrator.poni2,
+                integrator.wavelength,
+                self._ai_params["pixel_size"],
+                self._ai_params["int_pts"],
+                tuple(self._ai_params["int_rng"]))
+
+    def _cached_transform(self, name, key, mask, cls, build):
+        """Load a transform from the warm cache, or build and store it."""
+        # the mask version is only meaningful within this process
+        disk_key = key[:1] + key[2:] + (
+            None if mask is None else array_hash(mask),)
+        arrays = self._cache.load(name, disk_key)
+        if arrays is not None:
+            return cls.from_arrays(arrays)
+        transform = build()
+        self._cache.save(name, disk_key, **transform.to_arrays())
+        return transform
 
     def _update_integrator(self):
+        with self._ai_lock:
+            return self._build_integrator()
+
+    def _warm_integrator(self):
+        """Build the integrator and the pyFAI integration engine of the
+        current method and mask, otherwise done by the next train."""
+        try:
+            integrator = self._update_integrator()
+            shape = self._image_shape
+            if self._analysis_type != "AzimuthalIntegration" \
+                    or self._sparse_threshold is not None \
+                    or shape is None:
+                return
+            integrator.integrate1d(np.zeros(shape, dtype=np.float32),
+                                   self._ai_params["int_pts"],
+                                   method=self._ai_params["int_mthd"],
+                                   radial_range=self._ai_params["int_rng"],
+                                   correctSolidAngle=True,
+                                   polarization_factor=1,
+                                   mask=self._masks.get(shape),
+                                   unit="q_A^-1")
+        except Exception as ex:
+            print(repr(ex))
+
+    def _build_integrator(self):
+        from pyFAI.azimuthalIntegrator import AzimuthalIntegrator
+        from scipy import constants
+
         constant = 1e-3 * constants.c * constants.h / constants.e
         self._wavelength = constant / self._ai_params["energy"]
         self._distance = self._ai_params["distance"]
@@ -189,27 +703,124 @@ class DataProcessorWorker(Thread):
         if self._analysis_type != value:
             self._analysis_type = value
             self._fom.clear()
+            self._accumulators.clear()
+            self._binner = None
+            self._pp_accumulators = {}
+            self._xpcs_rings = None
 
     def onAiParamsChange(self, value):
         if self._ai_params != value:
             self._ai_params = value
+            self._accumulators.clear()
+            self._binner = None
+            self._pp_accumulators = {}
+            self._xpcs_rings = None
+            if value is not None:
+                Thread(target=self._warm_integrator, daemon=True).start()
+
+    def onPumpProbeChange(self, on_pattern, off_pattern):
+        patterns = None
+        if on_pattern and off_pattern:
+            patterns = (on_pattern, off_pattern)
+        if self._pp_patterns != patterns:
+            self._pp_patterns = patterns
+            self._pp_accumulators = {}
+
+    def onCorrelationChange(self, source, prop, v_min, v_max, n_bins):
+        self._slow_source = source
+        self._slow_prop = prop
+        params = None
+        if None not in (v_min, v_max, n_bins) and v_max > v_min \
+                and n_bins > 0:
+            params = (v_min, v_max, int(n_bins))
+        if self._corr_params != params:
+            self._corr_params = params
+            self._binner = None
+
+    def resetCorrelation(self):
+        self._binner = None
+
+    def onAveragingChange(self, mode, window):
+        mode = None if mode == "None" else mode
+        window = max(int(window or 1), 1)
+        if self._avg_mode != mode or self._avg_window != window:
+            self._avg_mode = mode
+            self._avg_window = window
+            self._accumulators = {}
+
+    def onSparseChange(self, threshold):
+        """Analyse the pixels above threshold as sparse events, or the
+        dense frames if None."""
+        if self._sparse_threshold != threshold:
+            self._sparse_threshold = threshold
+            self._accumulators.clear()
+            self._pp_accumulators = {}
 
     def onGeomFileChange(self, value):
         if self._geom_file != value:
             self._geom_file = value
-            try:
-                if config["DETECTOR"] == 'LPD':
-                    quad_positions = config["LPD"]["quad_positions"]
-                    self._geom = LPD_1MGeometry.from_h5_file_and_quad_positions(
-                        self._geom_file, quad_positions)
-                elif config["DETECTOR"] == 'AGIPD':
-                    self._geom = AGIPD_1MGeometry.from_crystfel_geom(filename)
-            except Exception as ex:
-                print(ex)
+            self._geom = None
+            self._pixel_map = None
+
+    def onMaskChange(self, mask_file, edge_mask, rects):
+        self._masks.set_file(mask_file)
+        self._masks.set_edge_mask(edge_mask)
+        self._masks.set_rects(rects)
+
+    def onRecordingChange(self, state, filename):
+        if state and self._recorder is None and filename:
+            from .recorder import DataRecorder
+            self._recorder = DataRecorder(filename)
+            self._recorder.set_maxsize(
+                self.DEGRADATION[self._memory_level][3])
+            self._recorder.start()
+        elif not state and self._recorder is not None:
+            self._recorder.terminate()
+            self._recorder = None
+
+    def onMemoryLevelChange(self, level):
+        """Limit pulses and history buffers, see DEGRADATION.
+
+        Called by the governor thread, the limits are applied before the
+        next train is post-processed, so that the history is not changed
+        while in use.
+        """
+        self._pending_memory_level = level
+
+    def _apply_memory_level(self, level):
+        self._memory_level = level
+        max_pulses, fom_history, max_window, record_queue = \
+            self.DEGRADATION[level]
+        self._max_pulses = max_pulses
+        self._fom = deque(self._fom, maxlen=fom_history)
+        if self._max_avg_window != max_window:
+            self._max_avg_window = max_window
+            self._accumulators = {}
+        if self._recorder is not None:
+            self._recorder.set_maxsize(record_queue)
+
+    def recorder_stats(self):
+        if self._recorder is None:
+            return None
+        return self._recorder.stats()
 
     def onSourceNameChange(self, value):
         self._source_name = value
 
+    def _params(self):
+        """Snapshot of the parameters, see `apply_params`."""
+        mask_file, edge_mask, mask_rects = self._masks.settings()
+        return dict(detector=config["DETECTOR"],
+                    analysis_type=self._analysis_type,
+                    ai_params=self._ai_params,
+                    source_name=self._source_name,
+                    geom_file=self._geom_file,
+                    mask_file=mask_file,
+                    edge_mask=edge_mask,
+                    mask_rects=mask_rects,
+                    pp_patterns=self._pp_patterns,
+                    sparse_threshold=self._sparse_threshold)
+
     def terminate(self):
         self._running = False
 
@@ -217,12 +828,46 @@ class DataProcessorWorker(Thread):
 class ProcessedData:
     def __init__(self, tid):
         self._tid = tid
+        self.n_pulses = 0
         self.projection_x = None
         self.projection_y = None
         self.momentum = None
         self.intensities = None
         self.image = None
+        self.slow_value = None
+        self.correlation = None
+        # curves of pumped and unpumped pulses, by curve name
+        self.pump_probe = None
+        self.pump_probe_avg = None
+        self.n_pump_probe = 0
+        self.mask = None
+        self.azimuthal = None
+        # cakes of the pulses selected by the "cake_pulses" pattern, and
+        # their indices in the train
+        self.cakes = None
+        self.cake_pulses = None
+        self.cake = None
+        self.foms = None
         self.fom = None
+        # averages over trains, only set when averaging is enabled
+        self.image_avg = None
+        self.intensities_avg = None
+        self.projection_x_avg = None
+        self.projection_y_avg = None
+        self.cake_avg = None
+        self.n_averaged = 0
+        # sparse mode only: fraction of pixels above threshold and
+        # (counts, edges) of the event values
+        self.occupancy = None
+        self.event_histogram = None
+        # XPCS: correlation sums of the pulses and mean frame of the
+        # train, then g2(tau) of the pulses and of the trains by q ring
+        self.xpcs_sums = None
+        self.xpcs_frame = None
+        self.tau_pulses = None
+        self.g2_pulses = None
+        self.tau_trains = None
+        self.g2_trains = None
 
     @property
     def tid(self):
@@ -0,0 +1,280 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from multiprocessing import Process
+import queue
+from threading import Thread
+
+import numpy as np
+import zmq
+
+from .config import config
+from .data_processor import DataProcessorWorker, ProcessedData
+from .parallel import ReorderBuffer, apply_params
+from .xpcs import merge_sums
+
+
+def send_array(socket, header, array, flags=0, copy=False):
+    """Send header and array data as a two-frame message.
+
+    Without copy, the array is sent from its memory once the message
+    leaves the send queue and must not be modified until then.
+    """
+    array = np.ascontiguousarray(array)
+    header = dict(header, shape=array.shape, dtype=array.dtype.str)
+    socket.send_pyobj(header, flags | zmq.SNDMORE)
+    socket.send(array, flags, copy=copy)
+
+
+def shares_train_memory(array, data):
+    """Whether an array is a view of the arrays of a received train,
+    which the receiver may reuse for the next trains, see
+    `CompressedClient`."""
+    return any(isinstance(value, np.ndarray)
+               and np.may_share_memory(array, value)
+               for values in data.values() for value in values.values())
+
+
+def recv_array(socket):
+    """Receive a message sent by `send_array`.
+
+    The returned array is read-only, it is backed by the message frame.
+    """
+    header = socket.recv_pyobj()
+    frame = socket.recv(copy=False)
+    array = np.frombuffer(frame.buffer, dtype=header["dtype"])
+    return header, array.reshape(header["shape"])
+
+
+def merge_processed(parts):
+    """Merge the results of pulse ranges of the same train.
+
+    :param list parts: ProcessedData ordered by pulse range.
+
+    :return: ProcessedData of the full train.
+    """
+    non_empty = [part for part in parts if part.n_pulses > 0]
+    if len(non_empty) <= 1:
+        return non_empty[0] if non_empty else parts[0]
+    parts = non_empty
+
+    merged = ProcessedData(parts[0].tid)
+    merged.n_pulses = sum(part.n_pulses for part in parts)
+    merged.slow_value = parts[0].slow_value
+    merged.mask = parts[0].mask
+    merged.image = sum(part.image * part.n_pulses
+                       for part in parts) / merged.n_pulses
+    merged.momentum = parts[0].momentum
+    merged.azimuthal = parts[0].azimuthal
+    if all(part.cake is not None for part in parts):
+        merged.cake = sum(part.cake * part.n_pulses
+                          for part in parts) / merged.n_pulses
+    for key in ["intensities", "projection_x", "projection_y"]:
+        values = [getattr(part, key) for part in parts]
+        if all(value is not None for value in values):
+            setattr(merged, key, np.concatenate(values))
+    # not every pulse range has selected pulses
+    for key in ["cakes", "cake_pulses"]:
+        values = [getattr(part, key) for part in parts
+                  if getattr(part, key) is not None]
+        if values:
+            setattr(merged, key, np.concatenate(values))
+    if all(part.foms is not None for part in parts):
+        merged.foms = [fom for part in parts for fom in part.foms]
+    if all(part.xpcs_sums is not None for part in parts):
+        # correlations across the pulse ranges are lost
+        merged.xpcs_sums = []
+        for part in parts:
+            merge_sums(merged.xpcs_sums, part.xpcs_sums)
+        merged.xpcs_frame = sum(part.xpcs_frame * part.n_pulses
+                                for part in parts) / merged.n_pulses
+    if all(part.occupancy is not None for part in parts):
+        merged.occupancy = sum(part.occupancy * part.n_pulses
+                               for part in parts) / merged.n_pulses
+    if all(part.event_histogram is not None for part in parts):
+        merged.event_histogram = merge_histograms(
+            [part.event_histogram for part in parts])
+    return merged
+
+
+def merge_histograms(histograms):
+    """Add (counts, edges) histograms.
+
+    Histograms with fixed edges are added, otherwise the counts are
+    binned again by bin center over the range of all histograms.
+    """
+    edges = histograms[0][1]
+    if all(np.array_equal(other, edges) for _, other in histograms):
+        return sum(counts for counts, _ in histograms), edges
+
+    centers = np.concatenate([(other[:-1] + other[1:]) / 2
+                              for _, other in histograms])
+    weights = np.concatenate([counts for counts, _ in histograms])
+    value_range = (min(other[0] for _, other in histograms),
+                   max(other[-1] for _, other in histograms))
+    return np.histogram(centers, bins=len(edges) - 1, range=value_range,
+                        weights=weights)
+
+
+def run_node(dispatch_address, collect_address):
+    """Process tasks from a dispatcher until interrupted.
+
+    :param str dispatch_address: e.g. "tcp://hostname:45460".
+    :param str collect_address: e.g. "tcp://hostname:45461".
+    """
+    engine = DataProcessorWorker(None, None)
+    context = zmq.Context.instance()
+    tasks = context.socket(zmq.PULL)
+    # small receive buffer, so that the dispatcher balances the load
+    tasks.setsockopt(zmq.RCVHWM, 1)
+    tasks.connect(dispatch_address)
+    results = context.socket(zmq.PUSH)
+    results.connect(collect_address)
+
+    try:
+        while True:
+            header, stacked = recv_array(tasks)
+            tid = header["tid"]
+            try:
+                apply_params(engine, header["params"])
+                proc_data = engine.process_train(
+                    tid, engine.assemble_stacked(stacked),
+                    header["slow_value"], header["pulse_range"])
+            except Exception as ex:
+                print(repr(ex))
+                proc_data = ProcessedData(tid)
+            results.send_pyobj(
+                (header["seq"], header["part"], header["n_parts"], proc_data))
+    finally:
+        tasks.close(linger=0)
+        results.close(linger=0)
+
+
+class ProcessingNode(Process):
+    """Run a processing node in another process.
+
+    Stands in for a remote node when running on a single machine.
+    """
+    def __init__(self, dispatch_address, collect_address):
+        super().__init__()
+        self.daemon = True
+        self._dispatch_address = dispatch_address
+        self._collect_address = collect_address
+
+    def run(self):
+        """Override."""
+        run_node(self._dispatch_address, self._collect_address)
+
+
+class DistributedDataProcessor(DataProcessorWorker):
+    """Fan trains out to processing nodes over ZMQ PUSH/PULL.
+
+    Trains, or pulse ranges of trains if n_parts > 1, are pushed to the
+    nodes connected to the dispatch port. The results sent back to the
+    collect port are merged and put into the output queue in train ID
+    order.
+    """
+    def __init__(self, in_queue, out_queue, dispatch_port, collect_port,
+                 n_parts=1, max_pending=50):
+        super().__init__(in_queue, out_queue)
+
+        self._dispatch_port = dispatch_port
+        self._collect_port = collect_port
+        self._n_parts = max(int(n_parts), 1)
+        self._max_pending = max_pending
+        self._context = zmq.Context.instance()
+        self._local_results = queue.Queue()
+        self._collector = Thread(target=self._collect, daemon=True)
+
+    def _send(self, socket, header, array, copy=False):
+        timeout = int(config["TIME_OUT"] * 1000)
+        while self._running:
+            if socket.poll(timeout, zmq.POLLOUT):
+                send_array(socket, header, array, copy=copy)
+                return
+
+    def run(self):
+        self._running = True
+        self._collector.start()
+
+        tasks = self._context.socket(zmq.PUSH)
+        tasks.bind(f"tcp://*:{self._dispatch_port}")
+
+        seq = 0
+        while self._running:
+            try:
+                data, meta = self._in_queue.get(timeout=config["TIME_OUT"])
+            except queue.Empty:
+                continue
+
+            tid = next(iter(meta.values()))["timestamp.tid"]
+            stacked = self.stack(data)
+            if stacked is None or len(stacked) == 0:
+                self._local_results.put((seq, 0, 1, ProcessedData(tid)))
+            else:
+                bounds = np.linspace(
+                    0, len(stacked),
+                    min(self._n_parts, len(stacked)) + 1).astype(int)
+                params = self._params()
+                slow_value = self.slow_value(data)
+                # e.g. JungFrau data of a single module, queued trains
+                # would be overwritten by the receiver
+                copy = shares_train_memory(stacked, data)
+                for part, (start, stop) in enumerate(
+                        zip(bounds[:-1], bounds[1:])):
+                    header = dict(seq=seq, tid=tid, part=part,
+                                  pulse_range=(int(start), len(stacked)),
+                                  n_parts=len(bounds) - 1, params=params,
+                                  slow_value=slow_value)
+                    self._send(tasks, header, stacked[start:stop], copy)
+            seq += 1
+
+        tasks.close(linger=0)
+
+    def _collect(self):
+        results = self._context.socket(zmq.PULL)
+        results.bind(f"tcp://*:{self._collect_port}")
+        timeout = int(config["TIME_OUT"] * 1000)
+
+        reorder = ReorderBuffer()
+        parts = {}
+        while self._running:
+            received = []
+            if results.poll(timeout, zmq.POLLIN):
+                received.append(results.recv_pyobj())
+            while True:
+                try:
+                    received.append(self._local_results.get_nowait())
+                except queue.Empty:
+                    break
+
+            ready = []
+            for seq, part, n_parts, proc_data in received:
+                if seq < reorder.next:
+                    # arrived after it was given up
+                    continue
+                train_parts = parts.setdefault(seq, {})
+                train_parts[part] = proc_data
+                if len(train_parts) == n_parts:
+                    del parts[seq]
+                    merged = merge_processed(
+                        [train_parts[i] for i in range(n_parts)])
+                    if n_parts > 1:
+                        # pulse patterns refer to the pulses of the train
+                        self.process_pump_probe(merged)
+                    ready.extend(reorder.push(seq, merged))
+
+            while len(reorder) > self._max_pending:
+                # a task was lost, e.g. a node went away
+                ready.extend(reorder.skip())
+            for seq in [seq for seq in parts if seq < reorder.next]:
+                del parts[seq]
+
+            for proc_data in ready:
+                self._post_process(proc_data)
+                self._put(proc_data)
+
+        results.close(linger=0)
@@ -10,7 +10,7 @@ from multiprocessing import Process
 import re
 from time import time
 
-from karabo_data import RunDirectory, ZMQStreamer
+from .compression import CompressedStreamer
 from .config import config
 
 
@@ -26,8 +26,20 @@ def generate_meta(sources, tid):
     return meta
 
 
-def serve_files(path, port, fast_devices=None,
-                require_all=False, repeat_stream=True, **kwargs):
+def detector_devices(detector):
+    """Return the [('src', 'prop')] of the detector data in files."""
+    if detector in ["LPD", "AGIPD", "DSSC"]:
+        return [("*DET/*CH0:xtdf", "image.data")]
+    elif detector == "JungFrau":
+        return [("*/DET/*:daqOutput", "data.adc")]
+    elif detector == "FastCCD":
+        return [("*/DAQ/*:daqOutput", "data.image.pixels")]
+    raise NotImplementedError(f"Unknown Detector: {detector}")
+
+
+def serve_files(path, port, fast_devices=None, slow_devices=None,
+                require_all=False, repeat_stream=True, compression=None,
+                **kwargs):
     """Stream data from files through a TCP socket.
 
     Parameters
@@ -48,7 +60,13 @@ def serve_files(path, port, fast_devices=None,
         If set to True, will continue streaming when trains()
         iterator is empty. Trainids will be monotonically increasing.
         Default: False
+    compression: str
+        If set, stream with a CompressedStreamer instead of the
+        karabo bridge protocol, e.g. "auto", "blosc", "lz4", "zlib".
+        Default: None
     """
+    from karabo_data import RunDirectory, ZMQStreamer
+
     try:
         corr_data = RunDirectory(path)
         num_trains = len(corr_data.train_ids)
@@ -56,13 +74,20 @@ def serve_files(path, port, fast_devices=None,
         print(repr(ex))
         return
 
-    streamer = ZMQStreamer(port, **kwargs)
+    if compression:
+        streamer = CompressedStreamer(port, compression=compression)
+    else:
+        streamer = ZMQStreamer(port, **kwargs)
     streamer.start()
 
+    devices = None
+    if fast_devices or slow_devices:
+        devices = list(fast_devices or []) + list(slow_devices or [])
+
     counter = 0
     repeat_stream = False
     while True:
-        for tid, train_data in corr_data.trains(devices=fast_devices,
+        for tid, train_data in corr_data.trains(devices=devices,
                                                 require_all=require_all):
             # loop over corrected DataCollection
             if train_data:
@@ -82,23 +107,18 @@ def serve_files(path, port, fast_devices=None,
 class FileServer(Process):
     """Stream the file data in another process."""
 
-    def __init__(self, folder, port):
+    def __init__(self, folder, port, slow_devices=None, compression=None):
         """Initialization."""
         super().__init__()
         self._folder = folder
         self._port = port
+        self._slow_devices = slow_devices
+        self._compression = compression
 
     def run(self):
         """Override."""
-        detector = config["DETECTOR"]
-        if detector in ["LPD", "AGIPD", "DSSC"]:
-            fast_devices = [("*DET/*CH0:xtdf", "image.data")]
-        elif detector == "JungFrau":
-            fast_devices = [("*/DET/*:daqOutput", "data.adc")]
-        elif detector == "FastCCD":
-            fast_devices = [("*/DAQ/*:daqOutput", "data.image.pixels")]
-        else:
-            raise NotImplementedError(f"Unknown Detector: {detector}")
-
         serve_files(self._folder, self._port,
-                    fast_devices=fast_devices, require_all=True)
+                    fast_devices=detector_devices(config["DETECTOR"]),
+                    slow_devices=self._slow_devices,
+                    require_all=True,
+                    compression=self._compression)
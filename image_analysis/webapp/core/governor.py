@@ -0,0 +1,85 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from collections import deque
+import time
+from threading import Thread
+
+from ...helpers import get_process_memory
+
+
+class MemoryGovernor(Thread):
+    """Degrade the processing gracefully when memory runs short.
+
+    The resident memory of the process is compared with the budget
+    periodically. Above the budget the degradation level is increased,
+    below `recover` times the budget it is decreased again. Registered
+    actions are called with the new level on every change.
+    """
+    MAX_LEVEL = 3
+
+    def __init__(self, budget, interval=2., recover=0.7):
+        """Initialization.
+
+        :param float budget: memory budget in GB.
+        :param float interval: seconds between checks.
+        :param float recover: fraction of the budget below which the
+            level is decreased.
+        """
+        super().__init__()
+        self.daemon = True
+
+        self._budget = budget * 1024**3
+        self._interval = interval
+        self._recover = recover
+        self._level = 0
+        self._rss = 0
+        self._actions = []
+        self._log = deque(maxlen=20)
+        self._running = False
+
+    def register(self, action):
+        """Register a callable taking the degradation level."""
+        self._actions.append(action)
+
+    @property
+    def level(self):
+        return self._level
+
+    @property
+    def rss(self):
+        return self._rss
+
+    @property
+    def log(self):
+        return list(self._log)
+
+    def run(self):
+        self._running = True
+        while self._running:
+            self._rss = get_process_memory()
+            if self._rss > self._budget and self._level < self.MAX_LEVEL:
+                self._set_level(self._level + 1)
+            elif self._rss < self._recover * self._budget and self._level > 0:
+                self._set_level(self._level - 1)
+            time.sleep(self._interval)
+
+    def _set_level(self, level):
+        message = (f"{time.strftime('%H:%M:%S')} memory "
+                   f"{self._rss / 1024**3:.1f} / "
+                   f"{self._budget / 1024**3:.1f} GB, "
+                   f"degradation level {self._level} -> {level}")
+        print(message)
+        self._log.append(message)
+        self._level = level
+        for action in self._actions:
+            try:
+                action(level)
+            except Exception as ex:
+                print(repr(ex))
+
+    def terminate(self):
+        self._running = False
@@ -0,0 +1,164 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import os.path as osp
+
+import numpy as np
+
+
+def load_mask(filename):
+    """Load a bad pixel mask, non-zero pixels are masked.
+
+    :param str filename: .npy file or HDF5 file with a "mask" dataset.
+
+    :return: boolean array.
+    """
+    if osp.splitext(filename)[1] == ".npy":
+        return np.load(filename).astype(bool)
+
+    import h5py
+    with h5py.File(filename, "r") as f:
+        return f["mask"][()].astype(bool)
+
+
+# (slow scan, fast scan) size of the ASICs of the detector modules
+ASIC_SHAPES = {
+    "JungFrau": (256, 256),
+    "LPD": (32, 128),
+    "AGIPD": (64, 64),
+}
+
+
+def module_edge_mask(shape, asic_shape=(256, 256)):
+    """Mask the pixels at the edges of the ASICs of a module.
+
+    :param tuple shape: (slow scan, fast scan) shape of the module data,
+        or of JungFrau modules stacked along the slow scan axis.
+    :param tuple asic_shape: (slow scan, fast scan) size of an ASIC.
+    """
+    mask = np.zeros(shape, dtype=bool)
+    for axis, (size, asic_size) in enumerate(zip(shape, asic_shape)):
+        edges = np.arange(0, size, asic_size)
+        edges = np.unique(np.concatenate([edges, edges - 1]))
+        edges = edges[(edges >= 0) & (edges < size)]
+        index = [slice(None)] * len(shape)
+        index[axis] = edges
+        mask[tuple(index)] = True
+    return mask
+
+
+class MaskManager:
+    """Combine the pixel masks into one cached boolean mask.
+
+    Pixels are masked if True. The combined mask is only recomputed when
+    one of the inputs changes; `version` is increased every time so that
+    consumers, e.g. integrators, can cache on it as well.
+    """
+    def __init__(self):
+        self._file = None
+        self._file_mask = None
+        self._use_edge_mask = False
+        self._gap_mask = None
+        self._edge_mask = None
+        self._missing_mask = None
+        self._rects = ()
+
+        self._version = 0
+        self._mask = None
+        self._key = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def settings(self):
+        """Return the user settings (file, edge mask, rectangles)."""
+        return self._file, self._use_edge_mask, self._rects
+
+    def set_file(self, filename):
+        filename = filename or None
+        if self._file == filename:
+            return
+        self._file = filename
+        self._file_mask = None
+        if filename is not None:
+            try:
+                self._file_mask = load_mask(filename)
+            except Exception as ex:
+                print(repr(ex))
+        self._version += 1
+
+    def set_edge_mask(self, state):
+        if self._use_edge_mask != bool(state):
+            self._use_edge_mask = bool(state)
+            self._version += 1
+
+    def set_gap_mask(self, mask):
+        """Pixels not covered by the modules, derived from the geometry."""
+        if mask is not self._gap_mask:
+            self._gap_mask = mask
+            self._version += 1
+
+    def set_module_edges(self, mask):
+        """ASIC edges in the assembled image, derived from the geometry.
+
+        Without it, the images are taken as JungFrau modules stacked
+        along the slow scan axis.
+        """
+        if mask is not self._edge_mask:
+            self._edge_mask = mask
+            self._version += 1
+
+    def set_missing(self, mask):
+        """Pixels without data (NaN) in the current train, e.g. of
+        modules missing in the train."""
+        if mask is not None and not mask.any():
+            mask = None
+        if mask is None and self._missing_mask is None:
+            return
+        if mask is None or self._missing_mask is None \
+                or not np.array_equal(mask, self._missing_mask):
+            self._missing_mask = mask
+            self._version += 1
+
+    def set_rects(self, rects):
+        """User drawn rectangles [(x0, x1, y0, y1), ...] in pixels."""
+        rects = tuple(tuple(int(round(v)) for v in rect)
+                      for rect in (rects or []))
+        if self._rects != rects:
+            self._rects = rects
+            self._version += 1
+
+    def get(self, shape):
+        """Return the combined mask for images of the given shape."""
+        key = (self._version, tuple(shape))
+        if self._key == key:
+            return self._mask
+
+        mask = np.zeros(shape, dtype=bool)
+        if self._file_mask is not None:
+            if self._file_mask.shape == mask.shape:
+                mask |= self._file_mask
+            else:
+                print(f"Mask shape {self._file_mask.shape} does not match "
+                      f"image shape {mask.shape}")
+        if self._gap_mask is not None and self._gap_mask.shape == mask.shape:
+            mask |= self._gap_mask
+        if self._missing_mask is not None \
+                and self._missing_mask.shape == mask.shape:
+            mask |= self._missing_mask
+        if self._use_edge_mask:
+            if self._edge_mask is not None:
+                if self._edge_mask.shape == mask.shape:
+                    mask |= self._edge_mask
+            else:
+                mask |= module_edge_mask(mask.shape, ASIC_SHAPES["JungFrau"])
+        for x0, x1, y0, y1 in self._rects:
+            mask[max(y0, 0):max(y1 + 1, 0), max(x0, 0):max(x1 + 1, 0)] = True
+
+        self._mask = mask
+        self._key = key
+        return mask
@@ -0,0 +1,124 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import time
+
+import numpy as np
+
+
+def stack_sources(data, sources, key):
+    """Stack the arrays of several sources of a train.
+
+    :param dict data: train data.
+    :param list sources: source names, in the order of the modules.
+    :param str key: property of the arrays, e.g. "data.adc".
+
+    :return: (pulses, sources, ...) array, modules missing in the train
+        are filled with NaN; None if all are missing.
+    """
+    arrays = [data[src][key] if key in data.get(src, {}) else None
+              for src in sources]
+    present = [array for array in arrays if array is not None]
+    if not present:
+        return
+    n_pulses = min(array.shape[0] for array in present)
+    shape = present[0].shape[1:]
+    dtype = np.result_type(present[0].dtype, np.float32)
+
+    stacked = np.empty((n_pulses, len(sources)) + shape, dtype=dtype)
+    for i, array in enumerate(arrays):
+        if array is None or array.shape[1:] != shape:
+            stacked[:, i] = np.nan
+        else:
+            stacked[:, i] = array[:n_pulses]
+    return stacked
+
+
+class TrainMatcher:
+    """Merge the parts of trains arriving separately, by train ID.
+
+    Trains are released in train ID order once all parts arrived. At
+    most `window` trains wait for their parts; beyond that, and after
+    `timeout` seconds, the oldest train is released incomplete, or
+    dropped unless `allow_partial`. Parts arriving after their train was
+    released are dropped.
+    """
+    def __init__(self, parts, window=10, timeout=1., allow_partial=True):
+        """Initialization.
+
+        :param list parts: keys of the parts of a train, e.g. endpoints.
+        """
+        self._parts = set(parts)
+        self._window = window
+        self._timeout = timeout
+        self._allow_partial = allow_partial
+        # tid -> (arrival time, {part: (data, meta)})
+        self._pending = {}
+        self._last_tid = None
+
+        self.n_matched = 0
+        self.n_partial = 0
+        self.n_dropped = 0
+
+    def push(self, part, tid, data, meta):
+        """Add a part of a train.
+
+        :return: list of (data, meta) of the released trains.
+        """
+        if self._last_tid is not None and tid <= self._last_tid:
+            self.n_dropped += 1
+            return []
+
+        self._pending.setdefault(
+            tid, (time.monotonic(), {}))[1][part] = (data, meta)
+        return self._drain()
+
+    def expire(self):
+        """Release the trains waiting longer than the timeout.
+
+        :return: list of (data, meta) of the released trains.
+        """
+        return self._drain(time.monotonic() - self._timeout)
+
+    def _drain(self, deadline=None):
+        """Release trains in order while the first one is complete,
+        beyond the window or arrived before the deadline."""
+        ready = []
+        while self._pending:
+            first = min(self._pending)
+            arrival, parts = self._pending[first]
+            if not (parts.keys() >= self._parts
+                    or len(self._pending) > self._window
+                    or deadline is not None and arrival < deadline):
+                break
+            ready.extend(self._release(first))
+        return ready
+
+    def _release(self, tid):
+        _, parts = self._pending.pop(tid)
+        self._last_tid = tid
+        if parts.keys() >= self._parts:
+            self.n_matched += 1
+        elif self._allow_partial:
+            self.n_partial += 1
+        else:
+            self.n_dropped += 1
+            return []
+
+        data, meta = {}, {}
+        for part_data, part_meta in parts.values():
+            data.update(part_data)
+            meta.update(part_meta)
+        return [(data, meta)]
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        return dict(matched=self.n_matched,
+                    partial=self.n_partial,
+                    dropped=self.n_dropped,
+                    pending=len(self._pending))
@@ -0,0 +1,153 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from collections import defaultdict
+import multiprocessing as mp
+import os.path as osp
+import re
+import time
+
+import h5py
+
+from .data_processor import DataProcessorWorker
+from .file_server import detector_devices
+from .parallel import apply_params
+from .recorder import append_processed
+
+SEQUENCE_PATTERN = re.compile(r"-S(\d+)\.h5$")
+
+
+def sequence_chunks(run):
+    """Split the trains of a run at the sequence file boundaries.
+
+    Every source writes its own sequence files and their boundaries may
+    differ by a few trains, hence a chunk starts at the first train of
+    any file of its sequence and ends where the next chunk starts.
+
+    :param DataCollection run: run opened with karabo_data.
+
+    :return: list of (sequence, first train ID, last train ID + 1).
+    """
+    starts = defaultdict(list)
+    for f in run.files:
+        if len(f.train_ids) == 0:
+            continue
+        match = SEQUENCE_PATTERN.search(f.filename)
+        sequence = int(match.group(1)) if match else 0
+        starts[sequence].append(int(f.train_ids[0]))
+
+    sequences = sorted(starts)
+    bounds = [min(starts[seq]) for seq in sequences]
+    bounds.append(int(run.train_ids[-1]) + 1)
+    return [(seq, bounds[i], bounds[i + 1])
+            for i, seq in enumerate(sequences) if bounds[i + 1] > bounds[i]]
+
+
+def process_chunk(task):
+    """Process the trains of a chunk and write them to a part file.
+
+    Target of the worker processes. Trains are processed with
+    `DataProcessorWorker.process_train`, i.e. every train is written on
+    its own; averages over trains are left to the analysis of the files.
+
+    :return: (sequence, number of completely recorded trains, bytes
+        written, seconds).
+    """
+    sequence, start, stop, run_dir, params, slow, filename = task
+    from karabo_data import RunDirectory, by_id
+
+    t0 = time.perf_counter()
+    engine = DataProcessorWorker(None, None)
+    apply_params(engine, params)
+    if slow is not None:
+        engine.onCorrelationChange(*slow, None, None, None)
+
+    if params["detector"] == "JungFrau":
+        sources = params["source_name"]
+        if isinstance(sources, str):
+            sources = [sources]
+        devices = [(src, "data.adc") for src in sources]
+    else:
+        devices = detector_devices(params["detector"])
+    if slow is not None:
+        devices.append(tuple(slow))
+
+    n_trains, n_bytes, n_incomplete = 0, 0, 0
+
+    def write(f, batch):
+        nonlocal n_trains, n_bytes, n_incomplete
+        nbytes, incomplete = append_processed(f, batch)
+        n_bytes += nbytes
+        n_trains += len(batch) - incomplete
+        n_incomplete += incomplete
+
+    try:
+        run = RunDirectory(run_dir).select_trains(by_id[start:stop])
+        with h5py.File(filename, "w") as f:
+            batch = []
+            for tid, data in run.trains(devices=devices, require_all=True):
+                batch.append(engine.process_train(
+                    tid, engine.assemble(data), engine.slow_value(data)))
+                if len(batch) == 10:
+                    write(f, batch)
+                    batch = []
+            write(f, batch)
+    except Exception as ex:
+        print(f"Sequence {sequence}: {repr(ex)}")
+    if n_incomplete:
+        print(f"Sequence {sequence}: {n_incomplete} train(s) not "
+              f"completely recorded")
+
+    return sequence, n_trains, n_bytes, time.perf_counter() - t0
+
+
+def process_run(run_dir, filename, params, slow=None, n_workers=None):
+    """Process all trains of a run without the web interface.
+
+    The sequences of the run are processed in parallel by `n_workers`
+    processes, each writing `{filename stem}-S{sequence}.h5`. The file
+    `filename` links to the part files, one group per sequence.
+
+    :param str run_dir: run directory.
+    :param str filename: output HDF5 file.
+    :param dict params: parameters, see `DataProcessorWorker._params`.
+    :param tuple slow: (source, property) of a slow property recorded
+        with every train, or None.
+    :param int n_workers: number of processes, by default the number
+        of CPUs.
+    """
+    from karabo_data import RunDirectory
+
+    run = RunDirectory(run_dir)
+    chunks = sequence_chunks(run)
+    stem, _ = osp.splitext(filename)
+    parts = {seq: f"{stem}-S{seq:05d}.h5" for seq, _, _ in chunks}
+    tasks = [(seq, start, stop, run_dir, params, slow, parts[seq])
+             for seq, start, stop in chunks]
+    print(f"{len(run.train_ids)} trains in {len(tasks)} sequence(s)")
+
+    t0 = time.perf_counter()
+    n_trains, n_bytes = 0, 0
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(n_workers or mp.cpu_count()) as pool:
+        for i, (seq, trains, nbytes, elapsed) in enumerate(
+                pool.imap_unordered(process_chunk, tasks), 1):
+            n_trains += trains
+            n_bytes += nbytes
+            rate = trains / elapsed if elapsed > 0 else 0.
+            print(f"[{i}/{len(tasks)}] S{seq:05d}: {trains} trains in "
+                  f"{elapsed:.1f} s ({rate:.1f} trains/s)")
+    elapsed = time.perf_counter() - t0
+
+    with h5py.File(filename, "w") as f:
+        f.attrs["run"] = osp.abspath(run_dir)
+        f.attrs["analysis_type"] = str(params["analysis_type"])
+        for seq, part in sorted(parts.items()):
+            f[f"S{seq:05d}"] = h5py.ExternalLink(osp.basename(part), "/")
+
+    print(f"{n_trains} trains in {elapsed:.1f} s: "
+          f"{n_trains / elapsed:.1f} trains/s, "
+          f"{n_bytes / 1024**2 / elapsed:.1f} MB/s written to {filename}")
@@ -0,0 +1,263 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import queue
+from threading import Thread
+import time
+
+import numpy as np
+
+from .config import config
+from .data_processor import DataProcessorWorker, ProcessedData
+
+
+class ReorderBuffer:
+    """Release items in the order of their sequence numbers.
+
+    Items may be pushed in any order; `push` returns the items that
+    became ready, i.e. all items whose predecessors were already released.
+    """
+    def __init__(self, start=0):
+        self._next = start
+        self._pending = {}
+
+    def push(self, seq, item):
+        self._pending[seq] = item
+        ready = []
+        while self._next in self._pending:
+            ready.append(self._pending.pop(self._next))
+            self._next += 1
+        return ready
+
+    def skip(self):
+        """Give up on the next missing item, e.g. if a task was lost."""
+        if not self._pending:
+            return []
+        while self._next not in self._pending:
+            self._next += 1
+        return self.push(self._next, self._pending.pop(self._next))
+
+    @property
+    def next(self):
+        """Sequence number of the next item to be released."""
+        return self._next
+
+    def __len__(self):
+        return len(self._pending)
+
+
+def apply_params(engine, params):
+    """Apply a parameter snapshot to a processing engine."""
+    config["DETECTOR"] = params["detector"]
+    engine.onAnalysisTypeChange(params["analysis_type"])
+    engine.onAiParamsChange(params["ai_params"])
+    engine.onSourceNameChange(params["source_name"])
+    engine.onGeomFileChange(params["geom_file"])
+    engine.onMaskChange(
+        params["mask_file"], params["edge_mask"], params["mask_rects"])
+    engine.onPumpProbeChange(*(params["pp_patterns"] or (None, None)))
+    engine.onSparseChange(params.get("sparse_threshold"))
+
+
+def _process_loop(task_queue, result_queue):
+    """Target of the worker processes.
+
+    Every worker keeps its own engine, hence its own cached geometry and
+    integrator, which are only rebuilt when the parameters change.
+    """
+    engine = DataProcessorWorker(None, None)
+    buffers = {}
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        seq, tid, slot, name, shape, dtype, slow_value, params = task
+        # tells the collector which task is lost if this process dies
+        result_queue.put(("started", seq, os.getpid()))
+        if slot not in buffers or buffers[slot].name != name:
+            if slot in buffers:
+                buffers[slot].close()
+            buffers[slot] = shared_memory.SharedMemory(name=name)
+
+        stacked = np.ndarray(shape, dtype=dtype, buffer=buffers[slot].buf)
+        try:
+            apply_params(engine, params)
+            proc_data = engine.process_train(
+                tid, engine.assemble_stacked(stacked, copy=False), slow_value)
+        except Exception as ex:
+            print(repr(ex))
+            proc_data = ProcessedData(tid)
+        del stacked
+
+        result_queue.put(("done", seq, slot, proc_data))
+
+    for buffer in buffers.values():
+        buffer.close()
+
+
+class ParallelDataProcessor(DataProcessorWorker):
+    """Fan trains out to worker processes.
+
+    Stacked detector data is handed over through shared memory slots and
+    the results are put into the output queue in train ID order.
+    """
+    def __init__(self, in_queue, out_queue, n_workers, max_pending=50):
+        super().__init__(in_queue, out_queue)
+
+        self._n_workers = n_workers
+        self._max_pending = max_pending
+        ctx = mp.get_context("spawn")
+        self._ctx = ctx
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._workers = [self._new_worker() for _ in range(n_workers)]
+        # seq -> (tid, slot) of the dispatched tasks
+        self._in_flight = {}
+
+        # a few more slots than workers to keep all of them busy
+        self._slots = [None] * (n_workers + 2)
+        self._free_slots = queue.Queue()
+        for i in range(len(self._slots)):
+            self._free_slots.put(i)
+        self._collector = Thread(target=self._collect, daemon=True)
+
+    def _new_worker(self):
+        return self._ctx.Process(target=_process_loop,
+                                 args=(self._task_queue, self._result_queue),
+                                 daemon=True)
+
+    def _slot_buffer(self, slot, nbytes):
+        shm = self._slots[slot]
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self._slots[slot] = shm
+        return shm
+
+    def run(self):
+        self._running = True
+        for worker in self._workers:
+            worker.start()
+        self._collector.start()
+
+        seq = 0
+        while self._running:
+            try:
+                data, meta = self._in_queue.get(timeout=config["TIME_OUT"])
+            except queue.Empty:
+                continue
+
+            tid = next(iter(meta.values()))["timestamp.tid"]
+            stacked = self.stack(data)
+
+            slot = None
+            while self._running and slot is None:
+                try:
+                    slot = self._free_slots.get(timeout=config["TIME_OUT"])
+                except queue.Empty:
+                    continue
+            if slot is None:
+                break
+
+            if stacked is None:
+                # nothing to process, but keep the train in the sequence
+                self._result_queue.put(
+                    ("done", seq, slot, ProcessedData(tid)))
+            else:
+                stacked = np.asarray(stacked)
+                shm = self._slot_buffer(slot, stacked.nbytes)
+                np.copyto(np.ndarray(stacked.shape, dtype=stacked.dtype,
+                                     buffer=shm.buf), stacked)
+                self._in_flight[seq] = (tid, slot)
+                self._task_queue.put((seq, tid, slot, shm.name, stacked.shape,
+                                      stacked.dtype.str, self.slow_value(data),
+                                      self._params()))
+            seq += 1
+
+        self._shutdown()
+
+    def _collect(self):
+        reorder = ReorderBuffer()
+        # pid of a worker -> seq of the task it processes
+        started = {}
+        # seqs of the tasks given up when their worker died
+        lost = set()
+        last_check = time.monotonic()
+        while self._running:
+            ready = []
+            try:
+                message = self._result_queue.get(timeout=config["TIME_OUT"])
+            except queue.Empty:
+                message = None
+            else:
+                if message[0] == "started":
+                    _, seq, pid = message
+                    started[pid] = seq
+                else:
+                    _, seq, slot, proc_data = message
+                    self._in_flight.pop(seq, None)
+                    if seq in lost:
+                        # sent before its worker died, the slot is free
+                        lost.discard(seq)
+                    else:
+                        self._free_slots.put(slot)
+                        if seq >= reorder.next:
+                            ready.extend(reorder.push(seq, proc_data))
+
+            # also while the other workers keep sending results
+            if message is None \
+                    or time.monotonic() - last_check > config["TIME_OUT"]:
+                last_check = time.monotonic()
+                for seq in self._replace_dead_workers(started):
+                    tid, slot = self._in_flight.pop(seq)
+                    self._free_slots.put(slot)
+                    lost.add(seq)
+                    if seq >= reorder.next:
+                        ready.extend(reorder.push(seq, ProcessedData(tid)))
+
+            while len(reorder) > self._max_pending:
+                # a task was lost without its worker being replaced
+                ready.extend(reorder.skip())
+
+            for proc_data in ready:
+                self._post_process(proc_data)
+                self._put(proc_data)
+
+    def _replace_dead_workers(self, started):
+        """Restart the workers which died, e.g. killed when out of memory.
+
+        :return: seqs of the tasks lost with them.
+        """
+        lost = []
+        for i, worker in enumerate(self._workers):
+            if worker.is_alive() or not self._running:
+                continue
+            print(f"Worker {worker.pid} died with exit code "
+                  f"{worker.exitcode}, restarting it")
+            seq = started.pop(worker.pid, None)
+            if seq in self._in_flight:
+                lost.append(seq)
+            self._workers[i] = self._new_worker()
+            self._workers[i].start()
+        return lost
+
+    def _shutdown(self):
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=config["TIME_OUT"])
+            if worker.is_alive():
+                worker.terminate()
+        for shm in self._slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
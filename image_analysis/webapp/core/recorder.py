@@ -0,0 +1,235 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import queue
+from threading import Thread
+import time
+
+import h5py
+import numpy as np
+
+from .config import config
+
+
+FIELDS = ("image", "image_avg", "momentum", "intensities",
+          "intensities_avg", "projection_x", "projection_y", "foms",
+          "azimuthal", "cake", "cakes", "cake_pulses", "slow_value")
+
+# fields with one row per pulse, the number of pulses may vary by train
+PULSE_FIELDS = ("intensities", "projection_x", "projection_y", "foms",
+                "cakes", "cake_pulses")
+
+# per level of the multi-tau correlation sums, see MultiTauCorrelator
+XPCS_SUMS = ("products", "past", "future", "counts")
+
+
+def append_processed(f, batch, compression="gzip"):
+    """Append the fields of processed data to an HDF5 file.
+
+    Every field is written to the chunked, compressed dataset
+    `/{field}/data` together with `/{field}/trainId`. The pulses of the
+    PULSE_FIELDS are concatenated instead, the pulses of a train are
+    `data[first:first + count]` with `/{field}/first` and
+    `/{field}/count`, like in the index of the European XFEL files.
+    The pump-probe curves of a train are written to
+    `/pump_probe/{key}/on` and `/pump_probe/{key}/off`, the XPCS
+    correlation sums of its pulses to `/xpcs/level{level}/{sum}` and
+    the ring pixels of its mean frame to `/xpcs/frame`.
+
+    :param h5py.File f: file opened for writing.
+    :param list batch: ProcessedData.
+    :param str compression: HDF5 compression filter.
+
+    :return: (number of bytes written, number of trains of which a
+        field was not recorded because its shape changed).
+    """
+    n_bytes = 0
+    incomplete = set()
+
+    def append(path, items, per_pulse=False):
+        nonlocal n_bytes
+        nbytes, skipped = _append_field(
+            f, path, items, compression, per_pulse)
+        n_bytes += nbytes
+        incomplete.update(skipped)
+
+    for field in FIELDS:
+        append(field, [(proc_data.tid, getattr(proc_data, field))
+                       for proc_data in batch], field in PULSE_FIELDS)
+
+    keys = sorted({key for proc_data in batch if proc_data.pump_probe
+                   for key in proc_data.pump_probe})
+    for key in keys:
+        for i, name in enumerate(("on", "off")):
+            append(f"pump_probe/{key}/{name}",
+                   [(proc_data.tid, proc_data.pump_probe[key][i])
+                    for proc_data in batch
+                    if proc_data.pump_probe and key in proc_data.pump_probe])
+
+    # the sums of the trains add up to g2(tau), see `multi_tau_g2`
+    n_levels = max((len(proc_data.xpcs_sums) for proc_data in batch
+                    if proc_data.xpcs_sums), default=0)
+    for level in range(n_levels):
+        for i, name in enumerate(XPCS_SUMS):
+            append(f"xpcs/level{level}/{name}",
+                   [(proc_data.tid, proc_data.xpcs_sums[level][i])
+                    for proc_data in batch if proc_data.xpcs_sums
+                    and level < len(proc_data.xpcs_sums)])
+    append("xpcs/frame", [(proc_data.tid, proc_data.xpcs_frame)
+                          for proc_data in batch])
+    return n_bytes, len(incomplete)
+
+
+def _append_field(f, path, items, compression, per_pulse):
+    """Append the (train ID, value) items of a field, None values are
+    skipped.
+
+    :return: (number of bytes written, train IDs not recorded).
+    """
+    tids, values = [], []
+    for tid, value in items:
+        if value is not None:
+            tids.append(tid)
+            values.append(np.asarray(value))
+    if not values:
+        return 0, []
+
+    dset, tid_dset = _datasets(f, path, values[0], compression, per_pulse)
+    shape = dset.shape[1:]
+    if per_pulse:
+        keep = [i for i, value in enumerate(values)
+                if value.ndim > 0 and value.shape[1:] == shape]
+    else:
+        keep = [i for i, value in enumerate(values) if value.shape == shape]
+    skipped = [tid for i, tid in enumerate(tids) if i not in keep]
+    if skipped:
+        print(f"{path}: shape differs from {shape}, "
+              f"{len(skipped)} train(s) not recorded")
+    if not keep:
+        return 0, skipped
+
+    if per_pulse:
+        block = np.concatenate([values[i] for i in keep])
+        counts = [len(values[i]) for i in keep]
+        _append(f[path]["first"], dset.shape[0] + np.cumsum([0] + counts[:-1]))
+        _append(f[path]["count"], counts)
+    else:
+        block = np.stack([values[i] for i in keep])
+    _append(dset, block)
+    _append(tid_dset, [tids[i] for i in keep])
+    return block.nbytes, skipped
+
+
+def _append(dset, values):
+    n = dset.shape[0]
+    dset.resize(n + len(values), axis=0)
+    dset[n:] = values
+
+
+def _datasets(f, field, value, compression, per_pulse=False):
+    if field not in f:
+        group = f.create_group(field)
+        # a row is a pulse of the per pulse fields, else a train
+        row = value.shape[1:] if per_pulse else value.shape
+        group.create_dataset(
+            "data", shape=(0,) + row,
+            maxshape=(None,) + row,
+            chunks=(max(len(value), 1) if per_pulse else 1,) + row,
+            dtype=value.dtype,
+            compression=compression)
+        group.create_dataset(
+            "trainId", shape=(0,), maxshape=(None,),
+            chunks=(1024,), dtype=np.uint64)
+        if per_pulse:
+            for name in ("first", "count"):
+                group.create_dataset(
+                    name, shape=(0,), maxshape=(None,),
+                    chunks=(1024,), dtype=np.uint64)
+    return f[field]["data"], f[field]["trainId"]
+
+
+class DataRecorder(Thread):
+    """Append processed data to an HDF5 file in a background thread.
+
+    Trains are queued in a bounded buffer and written in batches with
+    `append_processed`; when the buffer is full the train is dropped
+    instead of blocking the processing.
+    """
+    def __init__(self, filename, maxsize=100, batch_size=10,
+                 compression="gzip"):
+        super().__init__()
+        self.daemon = True
+
+        self._filename = filename
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._batch_size = batch_size
+        self._compression = compression
+        self._running = False
+
+        self._n_written = 0
+        self._n_dropped = 0
+        self._n_bytes = 0
+        self._write_time = 0.
+
+    def record(self, proc_data):
+        """Queue processed data for writing, never blocks."""
+        try:
+            self._queue.put_nowait(proc_data)
+        except queue.Full:
+            self._n_dropped += 1
+
+    def run(self):
+        self._running = True
+        with h5py.File(self._filename, "a") as f:
+            while self._running or not self._queue.empty():
+                try:
+                    batch = [self._queue.get(timeout=config["TIME_OUT"])]
+                except queue.Empty:
+                    continue
+                while len(batch) < self._batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                t0 = time.perf_counter()
+                n_incomplete = self._write(f, batch)
+                f.flush()
+                self._write_time += time.perf_counter() - t0
+                self._n_written += len(batch) - n_incomplete
+                self._n_dropped += n_incomplete
+
+    def _write(self, f, batch):
+        """:return: number of trains not completely recorded."""
+        n_bytes, n_incomplete = append_processed(f, batch, self._compression)
+        self._n_bytes += n_bytes
+        return n_incomplete
+
+    def set_maxsize(self, maxsize):
+        """Change the number of trains which can be queued."""
+        with self._queue.mutex:
+            self._queue.maxsize = maxsize
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Return number of trains written and dropped (not queued, or
+        a field not recorded because its shape changed), MB written,
+        write throughput in MB/s and the number of queued trains."""
+        throughput = 0.
+        if self._write_time > 0:
+            throughput = self._n_bytes / 1024**2 / self._write_time
+        return dict(written=self._n_written,
+                    dropped=self._n_dropped,
+                    mbytes=self._n_bytes / 1024**2,
+                    throughput=throughput,
+                    backlog=self.backlog)
+
+    def terminate(self):
+        """Stop after the queued trains are written."""
+        self._running = False
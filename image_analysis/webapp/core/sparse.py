@@ -0,0 +1,129 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import numpy as np
+
+
+class SparseFrames:
+    """Pixels above a threshold in a stack of frames, as photon events.
+
+    At low occupancy the events are much smaller than the frames, and
+    reductions over them with bincount are proportionally faster than
+    over the dense frames. Pixels below the threshold count as zero.
+    """
+    def __init__(self, pulses, indices, values, n_pulses, shape):
+        """Initialization.
+
+        :param numpy.ndarray pulses: pulse of every event.
+        :param numpy.ndarray indices: flat pixel index of every event.
+        :param numpy.ndarray values: value of every event.
+        :param int n_pulses: number of frames.
+        :param tuple shape: shape of a frame.
+        """
+        self.pulses = pulses
+        self.indices = indices
+        self.values = values
+        self.n_pulses = n_pulses
+        self.shape = tuple(shape)
+        self.n_pixels = int(np.prod(self.shape))
+
+    @classmethod
+    def from_dense(cls, frames, threshold, mask=None, clip=None,
+                   chunk=64):
+        """Threshold a stack of frames.
+
+        :param numpy.ndarray frames: (pulses, *shape) array, not modified.
+        :param float threshold: pixels above are events, NaN never are.
+        :param numpy.ndarray mask: pixels excluded if True.
+        :param tuple clip: (min, max) the values are clipped to.
+        :param int chunk: number of frames thresholded at once, bounds
+            the size of the temporary arrays.
+        """
+        n_pulses = frames.shape[0]
+        flat = frames.reshape(n_pulses, -1)
+        keep = None if mask is None else ~mask.ravel()
+
+        pulses, indices, values = [], [], []
+        for start in range(0, n_pulses, chunk):
+            block = flat[start:start + chunk]
+            above = block > threshold
+            if keep is not None:
+                above &= keep
+            pulse, index = np.nonzero(above)
+            values.append(block[pulse, index].astype(np.float32))
+            pulses.append((pulse + start).astype(np.int32))
+            indices.append(index.astype(np.int32))
+
+        values = np.concatenate(values)
+        if clip is not None:
+            np.clip(values, *clip, out=values)
+        return cls(np.concatenate(pulses), np.concatenate(indices),
+                   values, n_pulses, frames.shape[1:])
+
+    @property
+    def n_events(self):
+        return len(self.values)
+
+    @property
+    def occupancy(self):
+        """Fraction of the pixels with an event."""
+        return self.n_events / max(self.n_pulses * self.n_pixels, 1)
+
+    def _per_pulse(self, bins, n_bins, valid=None):
+        """Sum the events into (pulses, n_bins) by bin index."""
+        pulses, values = self.pulses, self.values
+        if valid is not None:
+            pulses, values, bins = pulses[valid], values[valid], bins[valid]
+        sums = np.bincount(pulses.astype(np.int64) * n_bins + bins,
+                           weights=values,
+                           minlength=self.n_pulses * n_bins)
+        return sums.reshape(self.n_pulses, n_bins)
+
+    def to_dense(self, pulses):
+        """Return the (len(pulses), *shape) frames of some pulses.
+
+        :param numpy.ndarray pulses: increasing pulse indices.
+        """
+        frames = np.zeros((len(pulses), self.n_pixels), dtype=np.float32)
+        positions = np.searchsorted(pulses, self.pulses)
+        selected = positions < len(pulses)
+        selected[selected] = pulses[positions[selected]] \
+            == self.pulses[selected]
+        frames[positions[selected], self.indices[selected]] = \
+            self.values[selected]
+        return frames.reshape((len(pulses),) + self.shape)
+
+    def mean_image(self, dtype=np.float32):
+        sums = np.bincount(self.indices, weights=self.values,
+                           minlength=self.n_pixels)
+        return (sums / max(self.n_pulses, 1)).astype(dtype).reshape(
+            self.shape)
+
+    def projections(self, dtype=np.float32):
+        """Return the mean over rows and over columns of every frame,
+        like `DataProcessorWorker.process_roi`."""
+        n_rows, n_columns = self.shape
+        rows, columns = np.divmod(self.indices, n_columns)
+        projection_x = self._per_pulse(columns, n_columns) / n_rows
+        projection_y = self._per_pulse(rows, n_rows) / n_columns
+        return projection_x.astype(dtype), projection_y.astype(dtype)
+
+    def radial_profiles(self, bin_map):
+        """Return the (pulses, q) azimuthal integrals of the frames.
+
+        :param RadialBinMap bin_map: radial bin of every pixel.
+        """
+        bins = bin_map.index[self.indices]
+        sums = self._per_pulse(bins, len(bin_map.radial), valid=bins >= 0)
+        return (sums * bin_map.inv_norm).astype(np.float32)
+
+    def histogram(self, bins=10, range=None):
+        """Return the (counts, edges) of the event values.
+
+        :param tuple range: (min, max) of the bins, fixed edges make the
+            histograms of several frame stacks addable.
+        """
+        return np.histogram(self.values, bins=bins, range=range)
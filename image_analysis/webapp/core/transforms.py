@@ -0,0 +1,226 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+import numpy as np
+
+
+class PixelMap:
+    """Assemble modules data into images by fancy indexing.
+
+    The map is derived once from the geometry. It holds, for every
+    pixel of the assembled image, the flat index of the module pixel
+    placed there, or -1 for gaps between the modules.
+    """
+    def __init__(self, index, shape):
+        """Initialization.
+
+        :param numpy.ndarray index: flat index into modules data.
+        :param tuple shape: shape of the assembled image.
+        """
+        self._shape = tuple(shape)
+        index = index.ravel()
+        self._valid = np.flatnonzero(index >= 0)
+        self._source = index[self._valid]
+
+    @classmethod
+    def from_geometry(cls, geom, modules_shape):
+        n_pixels = int(np.prod(modules_shape))
+        positions, _ = geom.position_all_modules(
+            np.arange(n_pixels, dtype=np.float64).reshape(modules_shape))
+        index = np.where(np.isnan(positions), -1, positions).astype(np.int64)
+        return cls(index, positions.shape)
+
+    def to_arrays(self):
+        index = np.full(int(np.prod(self._shape)), -1, dtype=np.int64)
+        index[self._valid] = self._source
+        return dict(index=index, shape=np.array(self._shape))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays["index"], tuple(arrays["shape"]))
+
+    @property
+    def gap_mask(self):
+        mask = np.ones(int(np.prod(self._shape)), dtype=bool)
+        mask[self._valid] = False
+        return mask.reshape(self._shape)
+
+    def edge_mask(self, modules_shape, asic_shape):
+        """Mask the pixels at the ASIC edges of the modules.
+
+        :param tuple modules_shape: (modules, slow scan, fast scan).
+        :param tuple asic_shape: (slow scan, fast scan) size of an ASIC.
+        """
+        from .masks import module_edge_mask
+
+        edges = np.broadcast_to(
+            module_edge_mask(modules_shape[-2:], asic_shape), modules_shape)
+        mask = np.zeros(int(np.prod(self._shape)), dtype=bool)
+        mask[self._valid] = edges.ravel()[self._source]
+        return mask.reshape(self._shape)
+
+    def __call__(self, stacked, dtype=None):
+        """Assemble (pulses, *modules_shape) data.
+
+        :param numpy.dtype dtype: dtype of the images, by default the
+            dtype of the data, promoted to float if needed.
+        """
+        n_pulses = stacked.shape[0]
+        if dtype is None:
+            dtype = np.result_type(stacked.dtype, np.float32)
+        out = np.full((n_pulses, int(np.prod(self._shape))), np.nan,
+                      dtype=dtype)
+        out[:, self._valid] = stacked.reshape(n_pulses, -1)[:, self._source]
+        return out.reshape((n_pulses,) + self._shape)
+
+
+class CakeTransform:
+    """Regroup detector pixels into q-chi bins with a sparse matrix.
+
+    The matrix only depends on the geometry, so it is computed once and
+    applied to all pulses of a train with a single sparse product. Pixels
+    are not split between bins and intensities are normalized by the
+    solid angle and polarization of the pixels, like in pyFAI.
+    """
+    def __init__(self, integrator, shape, npt_rad, npt_azim,
+                 radial_range, mask=None):
+        """Initialization.
+
+        :param AzimuthalIntegrator integrator: integrator of the geometry.
+        :param tuple shape: shape of the images.
+        :param int npt_rad: number of q bins.
+        :param int npt_azim: number of chi bins.
+        :param tuple radial_range: (min, max) of q in 1/A.
+        :param numpy.ndarray mask: pixels excluded if True.
+        """
+        from scipy import sparse
+
+        self._shape = tuple(shape)
+        q = integrator.qArray(self._shape) / 10.
+        chi = np.rad2deg(integrator.chiArray(self._shape))
+        weights = integrator.solidAngleArray(self._shape) \
+            * integrator.polarization(self._shape, factor=1)
+
+        q_edges = np.linspace(*radial_range, npt_rad + 1)
+        chi_edges = np.linspace(-180, 180, npt_azim + 1)
+        self.radial = (q_edges[1:] + q_edges[:-1]) / 2.
+        self.azimuthal = (chi_edges[1:] + chi_edges[:-1]) / 2.
+
+        q_idx = np.digitize(q.ravel(), q_edges) - 1
+        chi_idx = np.clip(np.digitize(chi.ravel(), chi_edges) - 1,
+                          0, npt_azim - 1)
+        valid = (q_idx >= 0) & (q_idx < npt_rad)
+        if mask is not None:
+            valid &= ~mask.ravel()
+
+        pixels = np.flatnonzero(valid)
+        bins = chi_idx[pixels] * npt_rad + q_idx[pixels]
+        self._matrix = sparse.csr_matrix(
+            (np.ones(len(pixels), dtype=np.float32), (bins, pixels)),
+            shape=(npt_azim * npt_rad, q.size))
+
+        norm = self._matrix.dot(weights.ravel().astype(np.float64))
+        with np.errstate(divide='ignore'):
+            self._inv_norm = np.where(norm > 0, 1. / norm, np.nan)
+        self._cake_shape = (npt_azim, npt_rad)
+
+    def to_arrays(self):
+        return dict(shape=np.array(self._shape),
+                    cake_shape=np.array(self._cake_shape),
+                    radial=self.radial,
+                    azimuthal=self.azimuthal,
+                    inv_norm=self._inv_norm,
+                    data=self._matrix.data,
+                    indices=self._matrix.indices,
+                    indptr=self._matrix.indptr,
+                    matrix_shape=np.array(self._matrix.shape))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        from scipy import sparse
+
+        transform = cls.__new__(cls)
+        transform._shape = tuple(arrays["shape"])
+        transform._cake_shape = tuple(arrays["cake_shape"])
+        transform.radial = arrays["radial"]
+        transform.azimuthal = arrays["azimuthal"]
+        transform._inv_norm = arrays["inv_norm"]
+        transform._matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(arrays["matrix_shape"]))
+        return transform
+
+    @property
+    def shape(self):
+        return self._shape
+
+    def __call__(self, images, chunk=64):
+        """Compute the cakes of a stack of images.
+
+        :param numpy.ndarray images: (pulses, *shape) array.
+        :param int chunk: number of pulses transformed at once, bounds
+            the size of the temporary arrays.
+
+        :return: (pulses, chi, q) array.
+        """
+        n_pulses = images.shape[0]
+        flat = images.reshape(n_pulses, -1)
+        cakes = np.empty((n_pulses, self._matrix.shape[0]), dtype=np.float32)
+        for start in range(0, n_pulses, chunk):
+            stop = min(start + chunk, n_pulses)
+            # sparse products are not implemented for float16
+            block = flat[start:stop].astype(np.float32, copy=False)
+            cakes[start:stop] = self._matrix.dot(block.T).T * self._inv_norm
+        return cakes.reshape((n_pulses,) + self._cake_shape)
+
+
+class RadialBinMap:
+    """Radial bin of every pixel, to integrate sparse frames.
+
+    Pixels are not split between bins and intensities are normalized
+    like in CakeTransform.
+    """
+    def __init__(self, integrator, shape, npt_rad, radial_range,
+                 mask=None):
+        """Initialization.
+
+        :param AzimuthalIntegrator integrator: integrator of the geometry.
+        :param tuple shape: shape of the images.
+        :param int npt_rad: number of q bins.
+        :param tuple radial_range: (min, max) of q in 1/A.
+        :param numpy.ndarray mask: pixels excluded if True.
+        """
+        shape = tuple(shape)
+        q = integrator.qArray(shape) / 10.
+        weights = integrator.solidAngleArray(shape) \
+            * integrator.polarization(shape, factor=1)
+
+        edges = np.linspace(*radial_range, npt_rad + 1)
+        self.radial = (edges[1:] + edges[:-1]) / 2.
+
+        index = np.digitize(q.ravel(), edges) - 1
+        valid = (index >= 0) & (index < npt_rad)
+        if mask is not None:
+            valid &= ~mask.ravel()
+        self.index = np.where(valid, index, -1).astype(np.int32)
+
+        norm = np.bincount(self.index[valid],
+                           weights=weights.ravel()[valid].astype(np.float64),
+                           minlength=npt_rad)
+        with np.errstate(divide='ignore'):
+            self.inv_norm = np.where(norm > 0, 1. / norm, np.nan)
+
+    def to_arrays(self):
+        return dict(radial=self.radial, index=self.index,
+                    inv_norm=self.inv_norm)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        bin_map = cls.__new__(cls)
+        bin_map.radial = arrays["radial"]
+        bin_map.index = arrays["index"]
+        bin_map.inv_norm = arrays["inv_norm"]
+        return bin_map
@@ -0,0 +1,161 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from collections import deque
+
+import numpy as np
+
+from .sparse import SparseFrames
+
+
+class QRings:
+    """Pixels of the q rings and the sparse matrix summing them by ring."""
+    def __init__(self, labels, radial):
+        """Initialization.
+
+        :param numpy.ndarray labels: ring of every pixel, -1 if none.
+        :param numpy.ndarray radial: q at the center of the rings.
+        """
+        from scipy import sparse
+
+        labels = labels.ravel()
+        self.radial = radial
+        self.pixels = np.flatnonzero(labels >= 0)
+        rings = labels[self.pixels]
+        n_rings = len(radial)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(self.pixels), dtype=np.float32),
+             (rings, np.arange(len(self.pixels)))),
+            shape=(n_rings, len(self.pixels)))
+        self.n_pixels = np.maximum(
+            np.bincount(rings, minlength=n_rings), 1)[:, None]
+
+    def frames(self, images):
+        """Return the (pulses, ring pixels) values of images.
+
+        :param images: (pulses, *shape) array or SparseFrames.
+        """
+        if isinstance(images, SparseFrames):
+            frames = np.zeros((images.n_pulses, len(self.pixels)),
+                              dtype=np.float32)
+            if len(self.pixels) == 0:
+                return frames
+            columns = np.minimum(np.searchsorted(self.pixels, images.indices),
+                                 len(self.pixels) - 1)
+            inside = self.pixels[columns] == images.indices
+            frames[images.pulses[inside], columns[inside]] = \
+                images.values[inside]
+            return frames
+        flat = images.reshape(images.shape[0], -1)
+        return flat[:, self.pixels].astype(np.float32)
+
+    def means(self, columns):
+        """Return the (rings, n) means of (ring pixels, n) columns."""
+        return self.matrix.dot(columns) / self.n_pixels
+
+
+def merge_sums(sums, other):
+    """Add the correlation sums of `other` to `sums`, in place.
+
+    :return: the merged sums.
+    """
+    for level, level_sums in enumerate(other):
+        if level == len(sums):
+            sums.append([np.copy(a) for a in level_sums])
+        else:
+            for total, value in zip(sums[level], level_sums):
+                total += value
+    return sums
+
+
+def multi_tau_g2(sums, buffers):
+    """Return the (tau, g2) of multi-tau correlation sums.
+
+    :param list sums: (G, past, future, counts) per level, see
+        MultiTauCorrelator.
+    :param int buffers: frames per level.
+
+    :return: (taus, (rings, taus) array) with tau in frames.
+    """
+    taus, values = [], []
+    for level, (products, past, future, counts) in enumerate(sums):
+        lags = np.arange(1 if level == 0 else buffers // 2, buffers)
+        lags = lags[counts[lags] > 0]
+        if len(lags) == 0:
+            continue
+        with np.errstate(divide='ignore', invalid='ignore'):
+            g2 = (products[:, lags] * counts[lags]) \
+                / (past[:, lags] * future[:, lags])
+        taus.append(lags * 2**level)
+        values.append(g2)
+    if not taus:
+        return None, None
+    return np.concatenate(taus), np.concatenate(values, axis=1)
+
+
+class MultiTauCorrelator:
+    """Intensity correlation g2(tau) per q ring with the multi-tau scheme.
+
+    Level l holds the last `buffers` frames averaged over 2**l frames,
+    so that the memory grows with the logarithm of the number of frames.
+    For every new frame, the products with all buffered frames of its
+    level are reduced by ring with a single sparse product.
+    """
+    def __init__(self, buffers=8, max_levels=16):
+        self._m = buffers
+        self._max_levels = max_levels
+        self._buffers = []
+        self._pending = []
+        # per level: sums of the ring means of I(t) * I(t + tau), I(t)
+        # and I(t + tau) by lag, and the number of frame pairs by lag
+        self.sums = []
+
+    def add(self, frame, rings):
+        """Add the (ring pixels,) values of the next frame."""
+        self._add(0, frame, rings)
+
+    def _add(self, level, frame, rings):
+        if level == len(self._buffers):
+            n_rings = rings.matrix.shape[0]
+            self._buffers.append(deque(maxlen=self._m))
+            self._pending.append(None)
+            if level == len(self.sums):
+                self.sums.append([np.zeros((n_rings, self._m)),
+                                  np.zeros((n_rings, self._m)),
+                                  np.zeros((n_rings, self._m)),
+                                  np.zeros(self._m, dtype=np.int64)])
+
+        buffer = self._buffers[level]
+        buffer.appendleft(frame)
+        first = 1 if level == 0 else self._m // 2
+        lags = np.arange(first, len(buffer))
+        if len(lags):
+            products, past, future, counts = self.sums[level]
+            earlier = np.stack([buffer[lag] for lag in lags], axis=1)
+            products[:, lags] += rings.means(frame[:, None] * earlier)
+            past[:, lags] += rings.means(earlier)
+            future[:, lags] += rings.means(frame[:, None])
+            counts[lags] += 1
+
+        # pairs of frames are averaged into the next level
+        if self._pending[level] is None:
+            self._pending[level] = frame
+        else:
+            averaged = (self._pending[level] + frame) / 2.
+            self._pending[level] = None
+            if level + 1 < self._max_levels:
+                self._add(level + 1, averaged, rings)
+
+    def reset(self):
+        """Start a new series of frames, keeping the sums."""
+        self._buffers = []
+        self._pending = []
+
+    def merge(self, sums):
+        merge_sums(self.sums, sums)
+
+    def g2(self):
+        return multi_tau_g2(self.sums, self._m)
@@ -45,7 +45,9 @@ def get_stream_tab(config):
                                 ),
                             ],
                                 className="pretty_container one-third column"),
-                            html.Div(id="stream-info",
+                            html.Div([html.Div(id="stream-info"),
+                                      html.Div(id="compression-info"),
+                                      html.Div(id="matcher-info")],
                                      className="two-thirds column")], className="row")])
 
 
@@ -106,6 +108,28 @@ def get_plot_tab(config):
                         type='number',
                         value=config["int_pts"],
                         className="rightbox"),
+                     html.Label("Azimuthal points (2D):",
+                                className="leftbox"),
+                     dcc.Input(
+                        id='azim-pts',
+                        type='number',
+                        value=config["azim_pts"],
+                        className="rightbox"),
+                     html.Label("Cake pulses (2D):",
+                                className="leftbox"),
+                     dcc.Input(
+                        id='cake-pulses',
+                        type='text',
+                        value=config["cake_pulses"],
+                        className="rightbox"),
+                     html.Label("q rings (XPCS):",
+                                className="leftbox"),
+                     dcc.Input(
+                        id='xpcs-rings',
+                        type='number',
+                        min=1,
+                        value=config["xpcs_rings"],
+                        className="rightbox"),
                      html.Label("Integration range:",
                                 className="leftbox"),
                      dcc.RangeSlider(
@@ -121,12 +145,33 @@ def get_plot_tab(config):
                         max=10000.0,
                         value=config["mask_rng"],
                         className="rightbox"),
+                     html.Label("Event threshold:", className="leftbox"),
+                     dcc.Input(
+                        id='sparse-threshold',
+                        type='number',
+                        placeholder="dense frames",
+                        value=config["sparse_threshold"],
+                        className="rightbox"),
                      html.Label("Geometry:", className="leftbox"),
                      dcc.Input(
                         id='geom-file',
                         type='text',
                         value=config["geom_file"],
                         className="rightbox"),
+                     html.Label("Mask file:", className="leftbox"),
+                     dcc.Input(
+                        id='mask-file',
+                        type='text',
+                        value=config["mask_file"],
+                        className="rightbox"),
+                     dcc.Checklist(
+                        id='edge-mask',
+                        options=[{'label': 'Mask module edges',
+                                  'value': 'edges'}],
+                        value=[]),
+                     html.Button("Clear drawn masks", id='clear-mask'),
+                     html.Div(id="mask-info"),
+                     dcc.Store(id='mask-rects', data=[]),
 
                      ], className="pretty_container six columns"),
                 html.Div([
@@ -134,13 +179,17 @@ def get_plot_tab(config):
                     dcc.Dropdown(
                         id='source',
                         options=[{'label': i, 'value': i} for i in config["source_name"]],
-                        value=config["source_name"][0]),
+                        value=[config["source_name"][0]],
+                        multi=True),
                     html.Hr(),
                     html.Label("Analysis Type:", className="leftbox"),
                     dcc.Dropdown(
                         id='analysis-type',
                         options=[{'label': i, 'value': i}
-                                 for i in ["AzimuthalIntegration", "ROI"]],
+                                 for i in ["AzimuthalIntegration",
+                                           "AzimuthalIntegration2D",
+                                           "ROI",
+                                           "XPCS"]],
                         value="AzimuthalIntegration",
                         className="rightbox"),
                     html.Label("Projection:", className="leftbox"),
@@ -149,6 +198,33 @@ def get_plot_tab(config):
                         options=[{'label': i, 'value': f"projection_{i}"} for i in ['x', 'y']],
                         value="projection_x",
                         className="rightbox"),
+                    html.Hr(),
+                    html.Label("Averaging:", className="leftbox"),
+                    dcc.Dropdown(
+                        id='avg-mode',
+                        options=[{'label': i, 'value': i}
+                                 for i in ["None", "Rolling", "Exponential"]],
+                        value="None",
+                        className="rightbox"),
+                    html.Label("Window (trains):", className="leftbox"),
+                    dcc.Input(
+                        id='avg-window',
+                        type='number',
+                        min=1,
+                        value=10,
+                        className="rightbox"),
+                    html.Hr(),
+                    html.Label("Record to:", className="leftbox"),
+                    dcc.Input(
+                        id='record-file',
+                        type='text',
+                        placeholder="HDF5 file",
+                        className="rightbox"),
+                    daq.BooleanSwitch(
+                        id='record',
+                        on=False),
+                    html.Div(id="record-state"),
+                    html.Div(id="record-info"),
                     html.Div(id="logger")
                 ], className="pretty_container six columns")
 
@@ -194,11 +270,76 @@ def get_plot_tab(config):
                         id='fom-plot')],
                     className="pretty_container eight columns")],
             className="row"),
+
+            html.Div([
+                html.Div(
+                    [html.Label("Correlate FOM with"),
+                     html.Hr(),
+                     html.Label("Slow source:", className="leftbox"),
+                     dcc.Input(
+                        id='slow-source',
+                        type='text',
+                        placeholder="e.g. FXE_SMS_USR/MOTOR/UM01",
+                        className="rightbox"),
+                     html.Label("Property:", className="leftbox"),
+                     dcc.Input(
+                        id='slow-prop',
+                        type='text',
+                        placeholder="e.g. actualPosition.value",
+                        className="rightbox"),
+                     html.Label("Min:", className="leftbox"),
+                     dcc.Input(
+                        id='corr-min',
+                        type='number',
+                        className="rightbox"),
+                     html.Label("Max:", className="leftbox"),
+                     dcc.Input(
+                        id='corr-max',
+                        type='number',
+                        className="rightbox"),
+                     html.Label("Bins:", className="leftbox"),
+                     dcc.Input(
+                        id='corr-bins',
+                        type='number',
+                        min=1,
+                        value=20,
+                        className="rightbox"),
+                     html.Button("Reset", id='corr-reset'),
+                     html.Div(id="corr-info")],
+                    className="pretty_container four columns"),
+                html.Div(
+                    [dcc.Graph(
+                        id='correlation-plot')],
+                    className="pretty_container eight columns")],
+            className="row"),
+
+            html.Div([
+                html.Div(
+                    [html.Label("Pump-probe"),
+                     html.Hr(),
+                     html.Label("On pulses:", className="leftbox"),
+                     dcc.Input(
+                        id='pp-on',
+                        type='text',
+                        placeholder="e.g. 0::2",
+                        className="rightbox"),
+                     html.Label("Off pulses:", className="leftbox"),
+                     dcc.Input(
+                        id='pp-off',
+                        type='text',
+                        placeholder="e.g. 1::2",
+                        className="rightbox")],
+                    className="pretty_container four columns"),
+                html.Div(
+                    [dcc.Graph(
+                        id='pp-plot')],
+                    className="pretty_container eight columns")],
+            className="row"),
         ])
     return div
 
 
-def get_layout(UPDATE_INT, config=None):
+def get_layout(UPDATE_INT, config=None, push=False):
 
     app_layout = html.Div([
 
@@ -206,7 +347,15 @@ def get_layout(UPDATE_INT, config=None):
             dcc.Interval(
                 id='interval_component',
                 interval=UPDATE_INT * 1000,
-                n_intervals=0),
+                n_intervals=0,
+                disabled=push),
+            # clicked by assets/push.js on server-sent events
+            html.Button(
+                id='push-trigger',
+                n_clicks=0,
+                style=dict(display='none'),
+                **{'data-push': 'on' if push else 'off',
+                   'data-url': '/_push/events'}),
             dcc.Interval(
                 id='psutil_component',
                 interval=2 * 1000,
@@ -229,6 +378,7 @@ def get_layout(UPDATE_INT, config=None):
                 style=dict(textAlign="center")
             ),
         ]),
+        html.Div(id='governor-info', style=dict(textAlign="center")),
         daq.LEDDisplay(
             id='train-id',
             value=1000,
@@ -0,0 +1,109 @@
+"""
+Image analysis and web visualization
+
+Author: Ebad Kamil <kamilebad@gmail.com>
+All rights reserved.
+"""
+from collections import OrderedDict
+import json
+from threading import Condition
+
+from flask import Response
+
+# panel (graph id) -> ProcessedData fields displayed in it
+PANELS = {
+    "mean-image": ("image", "image_avg"),
+    "histogram": ("image",),
+    "ai-integral": ("intensities", "projection_x", "projection_y", "cake",
+                    "g2_pulses"),
+    "fom-plot": ("foms",),
+    "correlation-plot": ("correlation",),
+    "pp-plot": ("pump_probe_avg",),
+}
+
+
+def changed_panels(previous, current):
+    """Return the panels whose data differ between two snapshots.
+
+    Fields are compared by identity: the processing sets new objects
+    only for changed data, e.g. the correlation statistics are kept
+    while the slow value is out of range, and leaves fields without
+    data of the train None.
+    """
+    changed = []
+    for panel, fields in PANELS.items():
+        for field in fields:
+            value = getattr(current, field)
+            if value is not None and (
+                    previous is None or getattr(previous, field) is not value):
+                changed.append(panel)
+                break
+    return changed
+
+
+class SnapshotNotifier:
+    """Hold the latest processed data and wake up the waiting clients.
+
+    The last few snapshots are kept by train ID, so that every viewer
+    can render the train it was told about, whatever arrived since.
+    """
+    def __init__(self, history=5):
+        self._condition = Condition()
+        self._data = None
+        self._panels = []
+        self._version = 0
+        self._history = OrderedDict()
+        self._maxlen = history
+
+    def publish(self, data):
+        with self._condition:
+            self._panels = changed_panels(self._data, data)
+            self._data = data
+            self._version += 1
+            self._history[data.tid] = (data, self._panels)
+            while len(self._history) > self._maxlen:
+                self._history.popitem(last=False)
+            self._condition.notify_all()
+
+    def set_history(self, history):
+        with self._condition:
+            self._maxlen = history
+            while len(self._history) > self._maxlen:
+                self._history.popitem(last=False)
+
+    @property
+    def latest(self):
+        return self._data, self._panels
+
+    def get(self, tid):
+        """Return (data, changed panels) of a recent train, or None."""
+        return self._history.get(tid)
+
+    def wait(self, version, timeout):
+        """Wait for a snapshot newer than `version`.
+
+        :return: (version, event) with event None on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._version > version, timeout=timeout)
+            if self._version <= version:
+                return version, None
+            return self._version, dict(
+                tid=self._data.tid, panels=self._panels)
+
+    def register(self, server, route="/_push/events", keepalive=15.):
+        """Add the server-sent events endpoint to the Flask server."""
+        def stream():
+            version = self._version
+            while True:
+                version, event = self.wait(version, keepalive)
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
+
+        @server.route(route)
+        def push_events():
+            return Response(stream(), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache"})
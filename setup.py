@@ -24,18 +24,26 @@ setup(name="image_analysis",
       entry_points={
           "console_scripts": [
               "web_image_analysis = image_analysis.application:run_dashservice",
+              "image_analysis_node = image_analysis.application:run_processing_node",
+              "offline_image_analysis = image_analysis.application:run_offline",
           ],
       },
       install_requires=[
            'karabo_data>=0.7.0',
            'dash>=1.6.1',
            'dash-daq>=0.3.1',
-           'pyFAI>0.16.0'
+           'pyFAI>0.16.0',
+           'h5py',
+           'pyzmq',
       ],
       extras_require={
         'test': [
           'pytest',
-        ]
+        ],
+        'compression': [
+          'blosc',
+          'lz4',
+        ],
       },
-      python_requires='>=3.6',
+      python_requires='>=3.8',
 )